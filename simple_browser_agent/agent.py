@@ -3,12 +3,19 @@ LangGraph-based Browser Agent
 
 This module implements the browser agent using LangGraph's state graph architecture.
 """
+import asyncio
+import hashlib
 import json
 import logging
+import uuid
+from contextlib import AsyncExitStack
+from functools import lru_cache
 from typing import Optional, Annotated, Literal
 from typing_extensions import TypedDict
 
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, ToolMessage, SystemMessage
+from langchain_core.messages.utils import trim_messages
+from langchain_core.utils.function_calling import convert_to_openai_tool
 from langchain_openai import AzureChatOpenAI
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
@@ -16,15 +23,50 @@ from langgraph.prebuilt import ToolNode
 
 from browser import SimpleBrowserSession
 from tools import create_browser_tools
-from prompts import SYSTEM_PROMPT
+from prompts import SYSTEM_PROMPT, SYSTEM_PROMPT_CORE
+from llm_cache import LLMCache, cached_ainvoke
+from rate_limiter import AsyncRateLimiter, get_rate_limiter
 
 logger = logging.getLogger(__name__)
 
+# Number of recent messages sent to the LLM verbatim (~3 steps).
+# Older turns are replaced by a single "State so far" summary message.
+MESSAGE_WINDOW = 12
+
+# History items kept in state. Only the most recent ones are shown to the
+# LLM, so older items are dropped instead of growing every checkpoint.
+HISTORY_LIMIT = 12
+
+# Longest tool result kept in a history item (extract can return whole pages;
+# the full text stays in the ToolMessage)
+RESULT_SUMMARY_LIMIT = 512
+
+# Stands in for screenshots that have left the message window
+SCREENSHOT_STUB = "[Earlier screenshot removed]"
+
+# Built once: every planning call leads with one of these fixed system
+# messages, forming the stable prefix for Azure prompt caching
+SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+# Same prompt without the worked examples, for steady-state steps
+SYSTEM_MESSAGE_CORE = SystemMessage(content=SYSTEM_PROMPT_CORE)
+
+# Planning steps that always get the full prompt with examples
+EXAMPLE_STEPS = 3
+
+# Planning response cache shared by every run in the process (when
+# cache_enabled), so a rerun of the same task reuses earlier responses
+PLANNING_CACHE = LLMCache()
+
 
 # ==============================================================
 # STATE DEFINITION
 # ==============================================================
 
+def add_history_items(existing: list, new: list) -> list:
+    """Reducer for history_items - append new items, keeping the last HISTORY_LIMIT"""
+    return (existing + new)[-HISTORY_LIMIT:]
+
+
 class BrowserAgentState(TypedDict):
     """
     State for the LangGraph browser agent.
@@ -33,12 +75,16 @@ class BrowserAgentState(TypedDict):
     """
     # Core LangGraph messages (for tool calling)
     messages: Annotated[list[BaseMessage], add_messages]
+    last_ai_idx: int  # Index of the latest planning AIMessage in messages
     
     # Browser context (current state)
     current_url: str
     current_title: str
     elements: str  # Interactive elements as formatted string
     screenshot: Optional[str]  # Base64 screenshot
+    screenshot_mime: str  # MIME type of the screenshot (e.g. image/webp)
+    screenshot_hash: Optional[str]  # Hash of the last screenshot sent to the LLM
+    screenshot_msg_idxs: list  # Indexes of messages still carrying a screenshot
     
     # Agent memory and task
     task: str  # Original task description
@@ -47,18 +93,14 @@ class BrowserAgentState(TypedDict):
     max_steps: int
     
     # History tracking (for context)
-    history_items: list  # List of history item dicts
+    history_items: Annotated[list, add_history_items]  # Recent history item dicts (bounded)
     
     # Control flags
     is_done: bool
+    next_route: str  # "action" or "done", decided by the planning node
     error: Optional[str]
 
 
-def add_history_items(existing: list, new: list) -> list:
-    """Reducer for history_items - append new items"""
-    return existing + new
-
-
 # ==============================================================
 # GRAPH NODE: OBSERVE BROWSER
 # ==============================================================
@@ -67,8 +109,10 @@ def create_observe_browser_node(browser: SimpleBrowserSession):
     """
     Create the observe_browser node with browser context injected.
     
-    This node captures the current browser state (URL, title, elements, screenshot)
-    and updates the graph state.
+    This node first records the previous action in history, then captures
+    the current browser state (URL, title, elements, screenshot) and
+    updates the graph state. Doing both in one node saves a graph step
+    (state reduce + checkpoint write) per iteration.
     """
     async def observe_browser(state: BrowserAgentState) -> dict:
         """
@@ -81,6 +125,10 @@ def create_observe_browser_node(browser: SimpleBrowserSession):
         logger.info(f"{'='*60}")
         logger.info("🔍 Observing browser state...")
         
+        # Record the previous action's result in history
+        history_update = update_history(state) if state['step_number'] > 0 else {}
+        memory = history_update.get('memory', state['memory'])
+        
         # Get browser state using CDP
         browser_state = await browser.observe_browser_state()
         
@@ -90,12 +138,18 @@ def create_observe_browser_node(browser: SimpleBrowserSession):
         logger.info(f"📋 Title: {browser_state['title']}")
         logger.info(f"📋 Elements found: {len(element_lines)} interactive elements")
         
-        # Build context message for the agent
-        context = f"""Step: {state['step_number'] + 1}/{state['max_steps']}
-Memory: {state['memory'] if state['memory'] else "Just started"}
-
-Agent History (what you did and what happened):
-{format_history(state['history_items'])}
+        step_number = state['step_number'] + 1
+        new_messages = []
+        
+        # The task goes out once, so it stays part of a stable prompt prefix
+        # that Azure/OpenAI prompt caching can reuse on every later step.
+        # Past actions and results are already in the message list.
+        if not state['messages']:
+            new_messages.append(HumanMessage(content=f"Task: {state['task']}"))
+        
+        # Per-step observation: short, appended after the stable prefix
+        context = f"""Step: {step_number}/{state['max_steps']}
+Memory: {memory if memory else "Just started"}
 
 Current Browser State:
 - URL: {browser_state['url']}
@@ -103,35 +157,55 @@ Current Browser State:
 - Interactive Elements:
 {browser_state['elements']}
 
-What should you do next to complete this task: {state['task']}"""
+What should you do next to complete the task?"""
+        new_messages.append(HumanMessage(content=context))
         
-        # Create message with screenshot if available
+        # Only re-send the screenshot when the page visibly changed
+        messages = state['messages']
+        screenshot_msg_idxs = list(state.get('screenshot_msg_idxs', ()))
+        screenshot_hash = state.get('screenshot_hash')
         if browser_state.get('screenshot'):
-            logger.info(f"📸 Screenshot available (size: {len(browser_state['screenshot'])} chars)")
-            message = HumanMessage(content=[
-                {
-                    "type": "text",
-                    "text": context
-                },
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{browser_state['screenshot']}",
-                        "detail": "high"
+            new_hash = hashlib.blake2b(
+                browser_state['screenshot'].encode('ascii'), digest_size=8
+            ).hexdigest()
+            if new_hash != screenshot_hash:
+                logger.info(f"📸 Screenshot changed (size: {len(browser_state['screenshot'])} chars)")
+                screenshot_msg_idxs.append(len(messages) + len(new_messages))
+                new_messages.append(HumanMessage(content=[
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{browser_state['screenshot_mime']};base64,{browser_state['screenshot']}",
+                            # Full detail for the first look, low detail afterwards
+                            "detail": "high" if screenshot_hash is None else "low"
+                        }
                     }
-                }
-            ])
+                ]))
+                screenshot_hash = new_hash
+            else:
+                logger.info("📸 Screenshot unchanged - not re-sending")
         else:
             logger.info("📝 Text-only mode (no screenshot)")
-            message = HumanMessage(content=context)
+        
+        # Screenshots that slid out of the message window are never sent to
+        # the LLM again - replace them (same id) with a stub so the state and
+        # every checkpoint don't keep carrying their base64 data
+        cutoff = len(messages) - MESSAGE_WINDOW
+        for idx in [i for i in screenshot_msg_idxs if i < cutoff]:
+            new_messages.append(HumanMessage(id=messages[idx].id, content=SCREENSHOT_STUB))
+            screenshot_msg_idxs.remove(idx)
         
         return {
+            **history_update,
             "current_url": browser_state["url"],
             "current_title": browser_state["title"],
             "elements": browser_state["elements"],
             "screenshot": browser_state.get("screenshot"),
-            "step_number": state["step_number"] + 1,
-            "messages": [message]
+            "screenshot_mime": browser_state.get("screenshot_mime", "image/png"),
+            "screenshot_hash": screenshot_hash,
+            "screenshot_msg_idxs": screenshot_msg_idxs,
+            "step_number": step_number,
+            "messages": new_messages
         }
     
     return observe_browser
@@ -141,11 +215,25 @@ What should you do next to complete this task: {state['task']}"""
 # GRAPH NODE: PLANNING
 # ==============================================================
 
-def create_planning_node(llm_with_tools):
+def create_planning_node(
+    llm_with_tools,
+    tools_sig: list = None,
+    temperature: Optional[float] = None,
+    cache: Optional[LLMCache] = None,
+    model: str = "",
+    stream: bool = False,
+    timeout: Optional[float] = None,
+    limiter: Optional[AsyncRateLimiter] = None
+):
     """
     Create the planning node with LLM injected.
     
     This node calls the LLM to plan what action to take next.
+    When a cache is given and temperature is 0, identical prompts are
+    answered from the cache instead of calling the LLM again.
+    With stream=True the response is streamed token by token, and a
+    timeout bounds how long a single LLM call may take. A limiter paces
+    calls to stay within the deployment's RPM/TPM quota.
     """
     async def planning(state: BrowserAgentState) -> dict:
         """
@@ -155,11 +243,23 @@ def create_planning_node(llm_with_tools):
         """
         logger.info("🤔 Agent deciding next action...")
         
-        # Prepare messages (system prompt + conversation history)
-        messages = [SystemMessage(content=SYSTEM_PROMPT)] + state["messages"]
+        # Prepare messages (system prompt + trimmed conversation history)
+        messages = [select_system_message(state), *build_planning_messages(state)]
         
-        # Call LLM with tools
-        response = await llm_with_tools.ainvoke(messages)
+        # Call LLM with tools (served from cache on deterministic reruns)
+        response = await asyncio.wait_for(
+            cached_ainvoke(
+                llm_with_tools,
+                messages,
+                tools_sig or [],
+                temperature,
+                cache,
+                model,
+                stream=stream,
+                limiter=limiter
+            ),
+            timeout=timeout
+        )
         
         # Log decision
         if response.tool_calls:
@@ -168,37 +268,60 @@ def create_planning_node(llm_with_tools):
         else:
             logger.info(f"📌 Decision: {response.content}")
         
-        return {"messages": [response]}
+        # add_messages appends, so the response lands at the current length
+        return {
+            "messages": [response],
+            "last_ai_idx": len(state["messages"]),
+            "next_route": route_after_planning(state, response)
+        }
     
     return planning
 
 
+def select_system_message(state: BrowserAgentState) -> SystemMessage:
+    """
+    Pick the system prompt for this planning step.
+    
+    The worked examples help most while the agent gets oriented and right
+    after a failed action, so they are only sent then. Every other step
+    sends the shorter core prompt, which stays byte-identical from step
+    to step for prompt caching.
+    """
+    if state['step_number'] <= EXAMPLE_STEPS:
+        return SYSTEM_MESSAGE
+    history_items = state['history_items']
+    if history_items and history_items[-1].get('failed'):
+        return SYSTEM_MESSAGE
+    return SYSTEM_MESSAGE_CORE
+
+
 # ==============================================================
-# GRAPH NODE: UPDATE HISTORY
+# HISTORY UPDATE (run by observe_browser)
 # ==============================================================
 
-async def update_history(state: BrowserAgentState) -> dict:
+def update_history(state: BrowserAgentState) -> dict:
     """
     Update history with the latest action and result.
     
     Extracts information from messages and creates a history item.
+    Called at the start of observe_browser after each action.
     """
     logger.info("📝 Updating history...")
     
-    # Find last AI message (the decision)
-    ai_messages = [m for m in state["messages"] if isinstance(m, AIMessage)]
-    if not ai_messages:
+    messages = state["messages"]
+    
+    # Last AI message (the decision) - index recorded by the planning node
+    last_ai_idx = state.get("last_ai_idx", -1)
+    if not 0 <= last_ai_idx < len(messages):
         return {}
     
-    last_ai = ai_messages[-1]
+    last_ai = messages[last_ai_idx]
     
-    # Find last tool message (the result)
-    tool_messages = [m for m in state["messages"] if isinstance(m, ToolMessage)]
-    if not tool_messages:
+    # Last tool message (the result) - the action node just appended it
+    last_tool = messages[-1]
+    if not isinstance(last_tool, ToolMessage):
         return {}
     
-    last_tool = tool_messages[-1]
-    
     # Extract action details
     if last_ai.tool_calls:
         tool_call = last_ai.tool_calls[0]
@@ -215,8 +338,15 @@ async def update_history(state: BrowserAgentState) -> dict:
         "next_goal": f"Execute {action}",  # We don't have explicit goal anymore
         "action": action,
         "action_params": action_params,
-        "result_summary": last_tool.content
+        "result_summary": truncate_result(last_tool.content),
+        # Tools report failures with ❌; ToolNode's own errors (bad arguments,
+        # exceptions) are marked with status "error" and an "Error:" prefix
+        "failed": (
+            getattr(last_tool, "status", None) == "error"
+            or last_tool.content.startswith(("❌", "Error"))
+        )
     }
+    history_item["rendered"] = render_history_item(history_item)
     
     # Check if task is done
     is_done = action == "done" or state["step_number"] >= state["max_steps"]
@@ -226,20 +356,23 @@ async def update_history(state: BrowserAgentState) -> dict:
     
     logger.info(f"✅ History updated: {action} → {last_tool.content[:80]}...")
     
-    return {
+    update = {
         "history_items": [history_item],
-        "memory": new_memory,
-        "is_done": is_done
+        "memory": new_memory
     }
+    # is_done starts False and only ever flips once - skip the no-op write
+    if is_done:
+        update["is_done"] = True
+    return update
 
 
 # ==============================================================
 # ROUTING FUNCTIONS
 # ==============================================================
 
-def should_continue(state: BrowserAgentState) -> Literal["action", "done"]:
+def route_after_planning(state: BrowserAgentState, response: AIMessage) -> Literal["action", "done"]:
     """
-    Determine whether to continue with action or end.
+    Decide where to go after planning, from the response just produced.
     
     Routes to:
     - "action" if LLM made a tool call and not done
@@ -255,54 +388,169 @@ def should_continue(state: BrowserAgentState) -> Literal["action", "done"]:
         logger.info("✅ Task marked as done")
         return "done"
     
-    # Check if last message has tool calls
-    if state["messages"]:
-        last_message = state["messages"][-1]
-        if isinstance(last_message, AIMessage) and last_message.tool_calls:
-            tool_name = last_message.tool_calls[0]["name"]
-            if tool_name == "done":
-                logger.info("✅ Done tool called")
-                return "done"
-            return "action"
+    # Check if the response has tool calls
+    if response.tool_calls:
+        if response.tool_calls[0]["name"] == "done":
+            logger.info("✅ Done tool called")
+            return "done"
+        return "action"
     
     # Default to done if no tool calls
     return "done"
 
 
+def should_continue(state: BrowserAgentState) -> Literal["action", "done"]:
+    """Route after planning using the decision the planning node recorded"""
+    return state["next_route"]
+
+
 # ==============================================================
 # HELPER FUNCTIONS
 # ==============================================================
 
+def build_planning_messages(state: BrowserAgentState, window: int = MESSAGE_WINDOW) -> list:
+    """
+    Cap the conversation sent to the LLM at a constant size.
+    
+    Keeps the task message, a synthetic "State so far" message that restates
+    memory and recent history, and the last `window` messages. The window
+    always starts on a HumanMessage so tool results are never orphaned from
+    the AIMessage that requested them.
+    """
+    messages = state["messages"]
+    if len(messages) <= window + 1:
+        return list(messages)
+    
+    task_message = messages[0]
+    recent = trim_messages(
+        messages[1:],
+        max_tokens=window,
+        token_counter=len,  # Count messages, not tokens
+        strategy="last",
+        start_on="human"
+    )
+    
+    summary = f"""State so far:
+- URL: {state.get('current_url', '')}
+- Memory: {state['memory'] if state['memory'] else "Just started"}
+
+Agent History (what you did and what happened):
+{format_history(state['history_items'])}"""
+    
+    # Screenshots are only re-sent when the page changes, so the latest one
+    # may have been trimmed away - carry it in the summary instead
+    has_image = any(isinstance(m.content, list) for m in recent)
+    if state.get('screenshot') and not has_image:
+        summary_message = HumanMessage(content=[
+            {"type": "text", "text": summary},
+            {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{state['screenshot_mime']};base64,{state['screenshot']}",
+                    "detail": "low"
+                }
+            }
+        ])
+    else:
+        summary_message = HumanMessage(content=summary)
+    
+    return [task_message, summary_message, *recent]
+
+
 def format_history(history_items: list) -> str:
     """Format history items for display to LLM"""
     if not history_items:
         return "No previous actions yet"
     
-    # Show last 5 steps
-    recent_items = history_items[-5:]
-    
-    lines = []
-    for item in recent_items:
-        params_str = str(item.get("action_params", {}))
-        lines.append(f"""<step_{item['step_number']}>
+    # Show last 5 steps (rendered once when each item was recorded)
+    return "\n".join(
+        item.get("rendered") or render_history_item(item)
+        for item in history_items[-5:]
+    )
+
+
+def truncate_result(text: str, limit: int = RESULT_SUMMARY_LIMIT) -> str:
+    """Cap a tool result at `limit` characters, noting how much was cut"""
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [+{len(text) - limit} chars]"
+
+
+def render_history_item(item: dict) -> str:
+    """Render one history item as the text block shown to the LLM"""
+    params_str = json.dumps(
+        item.get("action_params", {}), separators=(',', ':'), ensure_ascii=False
+    )
+    return f"""<step_{item['step_number']}>
 Goal: {item.get('next_goal', 'Unknown')}
 Action: {item['action']}({params_str})
 Result: {item['result_summary']}
-</step_{item['step_number']}>""")
-    
-    return "\n".join(lines)
+</step_{item['step_number']}>"""
 
 
 # ==============================================================
 # GRAPH BUILDER
 # ==============================================================
 
+@lru_cache(maxsize=16)
+def get_llm(
+    azure_endpoint: str,
+    model: str,
+    api_version: str,
+    api_key: str,
+    temperature: Optional[float] = None
+) -> AzureChatOpenAI:
+    """
+    Return a shared AzureChatOpenAI client for this configuration.
+    
+    Every agent using the same endpoint/deployment reuses one client and
+    therefore one HTTP connection pool, instead of paying new TCP/TLS
+    handshakes per task.
+    """
+    llm_kwargs = {}
+    if temperature is not None:
+        llm_kwargs["temperature"] = temperature
+    return AzureChatOpenAI(
+        api_key=api_key,
+        api_version=api_version,
+        azure_deployment=model,
+        azure_endpoint=azure_endpoint,
+        **llm_kwargs
+    )
+
+
+@lru_cache(maxsize=1)
+def get_tool_schemas():
+    """
+    Return the browser tools' OpenAI schemas and their digest.
+    
+    The schemas depend only on the tool signatures and docstrings, not on
+    the browser or LLM bound into them, so they are converted and hashed
+    once per process instead of on every graph build.
+    
+    Returns:
+        (list of OpenAI tool schemas, [schema digest])
+    """
+    tool_schemas = [convert_to_openai_tool(t) for t in create_browser_tools(None, None)]
+    tools_sig = [hashlib.sha256(
+        json.dumps(tool_schemas, sort_keys=True).encode("utf-8")
+    ).hexdigest()]
+    return tool_schemas, tools_sig
+
+
 def create_browser_agent_graph(
     browser: SimpleBrowserSession,
     model: str = "gpt-4o-mini",
     api_version: str = "2024-12-01-preview",
     azure_endpoint: str = None,
-    api_key: str = None
+    api_key: str = None,
+    temperature: Optional[float] = None,
+    cache_enabled: bool = False,
+    checkpointer=None,
+    stream: bool = False,
+    llm_timeout: Optional[float] = None,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None
 ):
     """
     Create the complete LangGraph browser agent.
@@ -313,27 +561,35 @@ def create_browser_agent_graph(
         api_version: Azure API version
         azure_endpoint: Azure endpoint URL
         api_key: Azure OpenAI API key
+        temperature: Sampling temperature (None = model default)
+        cache_enabled: Cache planning responses in the process-wide PLANNING_CACHE
+            (only used when temperature is 0)
+        checkpointer: Optional LangGraph checkpointer for resumable runs
+        stream: Stream planning responses token by token
+        llm_timeout: Seconds before a planning LLM call is abandoned
+        requests_per_minute: Client-side RPM limit for the deployment
+        tokens_per_minute: Client-side TPM limit for the deployment
         
     Returns:
         Compiled LangGraph
     """
     logger.info("🏗️ Building LangGraph browser agent...")
     
-    # Create single LLM client for both vision and planning
-    llm = AzureChatOpenAI(
-        api_key=api_key,
-        api_version=api_version,
-        azure_deployment=model,
-        azure_endpoint=azure_endpoint
-    )
+    # Single LLM client for both vision and planning (shared across agents)
+    llm = get_llm(azure_endpoint, model, api_version, api_key, temperature)
     logger.info(f"✅ LLM client configured: {model}")
     
+    # Shared per deployment, so concurrent agents draw from one quota
+    limiter = get_rate_limiter(azure_endpoint, model, requests_per_minute, tokens_per_minute)
+    
     # Create browser tools (using the same LLM)
-    browser_tools = create_browser_tools(browser, llm, model)
+    browser_tools = create_browser_tools(browser, llm, model, limiter=limiter)
     logger.info(f"✅ Created {len(browser_tools)} browser tools")
     
-    # Bind tools to LLM for planning
-    llm_with_tools = llm.bind_tools(browser_tools)
+    # Bind the tools' OpenAI schemas for planning.
+    # The schema digest identifies the tool set in the planning cache key.
+    tool_schemas, tools_sig = get_tool_schemas()
+    llm_with_tools = llm.bind_tools(tool_schemas)
     logger.info("✅ LLM configured with tools")
     
     # Create ToolNode for action execution
@@ -341,7 +597,17 @@ def create_browser_agent_graph(
     
     # Create graph nodes
     observe_browser = create_observe_browser_node(browser)
-    planning = create_planning_node(llm_with_tools)
+    cache = PLANNING_CACHE if cache_enabled else None
+    planning = create_planning_node(
+        llm_with_tools,
+        tools_sig=tools_sig,
+        temperature=temperature,
+        cache=cache,
+        model=model,
+        stream=stream,
+        timeout=llm_timeout,
+        limiter=limiter
+    )
     
     # Build the graph
     graph_builder = StateGraph(BrowserAgentState)
@@ -350,7 +616,6 @@ def create_browser_agent_graph(
     graph_builder.add_node("observe_browser", observe_browser)
     graph_builder.add_node("planning", planning)
     graph_builder.add_node("action", action_node)
-    graph_builder.add_node("update_history", update_history)
     
     # Set entry point
     graph_builder.set_entry_point("observe_browser")
@@ -368,14 +633,12 @@ def create_browser_agent_graph(
         }
     )
     
-    # After action, update history
-    graph_builder.add_edge("action", "update_history")
-    
-    # After history update, observe browser again (loop)
-    graph_builder.add_edge("update_history", "observe_browser")
+    # After action, observe browser again (loop) - observe_browser
+    # records the action's result in history first
+    graph_builder.add_edge("action", "observe_browser")
     
     # Compile graph
-    graph = graph_builder.compile()
+    graph = graph_builder.compile(checkpointer=checkpointer)
     logger.info("✅ Graph compiled successfully!")
     
     return graph
@@ -397,7 +660,18 @@ class LangGraphBrowserAgent:
         self,
         task: str,
         headless: bool = False,
-        max_steps: int = 30
+        max_steps: int = 30,
+        temperature: Optional[float] = None,
+        cache_enabled: bool = False,
+        screenshot_quality: int = 50,
+        checkpoint_db: Optional[str] = None,
+        thread_id: Optional[str] = None,
+        stream_tokens: bool = False,
+        timeout_seconds: Optional[float] = 1800,
+        llm_timeout_seconds: Optional[float] = 120,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+        browser: Optional[SimpleBrowserSession] = None
     ):
         """
         Initialize the browser agent.
@@ -406,6 +680,21 @@ class LangGraphBrowserAgent:
             task: The task description for the agent to complete
             headless: Whether to run browser in headless mode
             max_steps: Maximum number of steps before stopping
+            temperature: Sampling temperature (None = model default)
+            cache_enabled: Cache planning LLM responses for deterministic reruns
+            screenshot_quality: WebP quality (0-100) of screenshots sent to the LLM
+            checkpoint_db: SQLite file for LangGraph checkpoints (e.g. "agent_state.db").
+                Requires the langgraph-checkpoint-sqlite package.
+            thread_id: Checkpoint thread to resume (default: new id per agent)
+            stream_tokens: Print the planning LLM's text to stdout as it streams
+            timeout_seconds: Wall-clock limit for the whole run, including time
+                spent waiting on ask_user (None = no limit)
+            llm_timeout_seconds: Limit for a single planning LLM call (None = no limit)
+            requests_per_minute: Pace LLM calls under this RPM quota (None = unlimited)
+            tokens_per_minute: Pace LLM calls under this TPM quota (None = unlimited)
+            browser: Already started browser session to run in. The caller owns
+                it (start/reset/close), so one Chrome can serve several tasks.
+                headless and screenshot_quality are ignored when given.
             
         Environment Variables Required:
             AZURE_OPENAI_ENDPOINT: Azure OpenAI endpoint URL
@@ -417,6 +706,15 @@ class LangGraphBrowserAgent:
         
         self.task = task
         self.max_steps = max_steps
+        self.temperature = temperature
+        self.cache_enabled = cache_enabled
+        self.checkpoint_db = checkpoint_db
+        self.thread_id = thread_id or uuid.uuid4().hex
+        self.stream_tokens = stream_tokens
+        self.timeout_seconds = timeout_seconds
+        self.llm_timeout_seconds = llm_timeout_seconds
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
         
         # Load credentials from environment
         self.azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -436,8 +734,12 @@ class LangGraphBrowserAgent:
                 "in your .env file or environment."
             )
         
-        # Initialize browser
-        self.browser = SimpleBrowserSession(headless=headless)
+        # Initialize browser (unless the caller shares one across runs)
+        self._owns_browser = browser is None
+        self.browser = browser or SimpleBrowserSession(
+            headless=headless,
+            screenshot_quality=screenshot_quality
+        )
         
         # Graph will be created when run() is called
         self.graph = None
@@ -450,74 +752,194 @@ class LangGraphBrowserAgent:
             Final result string
         """
         # Start browser
-        await self.browser.start()
+        if self._owns_browser:
+            await self.browser.start()
         
         try:
-            # Create graph (LLM is created internally)
-            self.graph = create_browser_agent_graph(
-                self.browser,
-                self.model,
-                self.api_version,
-                self.azure_endpoint,
-                self.api_key
-            )
-            
-            # Initial state
-            initial_state = {
-                "messages": [],
-                "task": self.task,
-                "memory": "",
-                "step_number": 0,
-                "max_steps": self.max_steps,
-                "history_items": [],
-                "is_done": False,
-                "current_url": "",
-                "current_title": "",
-                "elements": "",
-                "screenshot": None,
-                "error": None
-            }
+            async with AsyncExitStack() as stack:
+                checkpointer = None
+                if self.checkpoint_db:
+                    try:
+                        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+                    except ImportError as e:
+                        raise ImportError(
+                            "checkpoint_db requires the langgraph-checkpoint-sqlite package.\n"
+                            "Install it with: pip install langgraph-checkpoint-sqlite"
+                        ) from e
+                    checkpointer = await stack.enter_async_context(
+                        AsyncSqliteSaver.from_conn_string(self.checkpoint_db)
+                    )
+                
+                # Create graph (LLM is created internally)
+                self.graph = create_browser_agent_graph(
+                    self.browser,
+                    self.model,
+                    self.api_version,
+                    self.azure_endpoint,
+                    self.api_key,
+                    temperature=self.temperature,
+                    cache_enabled=self.cache_enabled,
+                    checkpointer=checkpointer,
+                    stream=self.stream_tokens,
+                    llm_timeout=self.llm_timeout_seconds,
+                    requests_per_minute=self.requests_per_minute,
+                    tokens_per_minute=self.tokens_per_minute
+                )
+                
+                # Run graph with recursion limit
+                # Each step involves 3 nodes: observe_browser → planning → action
+                # So recursion_limit needs to be at least (max_steps * 3) + buffer
+                config = {
+                    "recursion_limit": self.max_steps * 5,  # 5x for safety margin
+                    "configurable": {"thread_id": self.thread_id}
+                }
+                
+                # Initial state (None resumes from the last checkpoint)
+                graph_input = self._initial_state()
+                if checkpointer:
+                    snapshot = await self.graph.aget_state(config)
+                    if snapshot.next:
+                        logger.info(f"♻️ Resuming thread {self.thread_id} at step {snapshot.values.get('step_number', 0)}")
+                        graph_input = None
+                        await self._restore_browser(snapshot, config)
+                    elif snapshot.values:
+                        logger.info(f"✅ Thread {self.thread_id} already finished - returning its result")
+                        return self._extract_result(snapshot.values)
+                
+                logger.info(f"\n{'='*70}")
+                logger.info("🚀 Starting LangGraph Browser Agent")
+                logger.info(f"{'='*70}")
+                logger.info(f"Task: {self.task}")
+                logger.info(f"Model: {self.model}")
+                logger.info(f"Max Steps: {self.max_steps}")
+                logger.info(f"{'='*70}\n")
+                
+                # Bound the whole run by wall-clock time - a hung CDP or LLM
+                # call would otherwise stall it indefinitely
+                final_state = {"messages": []}
+                try:
+                    await asyncio.wait_for(
+                        self._stream_graph(graph_input, config, final_state),
+                        timeout=self.timeout_seconds
+                    )
+                except asyncio.TimeoutError:
+                    # Either the run deadline or a single LLM call's deadline
+                    logger.warning("⏱️ Run timed out")
+                    return f"Timed out. Progress: {final_state.get('memory') or 'Unknown'}"
+                
+                return self._extract_result(final_state)
             
-            logger.info(f"\n{'='*70}")
-            logger.info("🚀 Starting LangGraph Browser Agent")
-            logger.info(f"{'='*70}")
-            logger.info(f"Task: {self.task}")
-            logger.info(f"Model: {self.model}")
-            logger.info(f"Max Steps: {self.max_steps}")
-            logger.info(f"{'='*70}\n")
+        finally:
+            if self._owns_browser:
+                await self.browser.close()
+    
+    async def _restore_browser(self, snapshot, config: dict):
+        """
+        Bring a resumed thread back in line with the freshly started browser.
+        
+        The checkpoint's history and element indexes describe the old
+        browser session, so reopen its last page and route the graph
+        through observe_browser before planning acts on any index. A
+        pending action is answered instead of run - it was chosen against
+        elements that no longer exist.
+        """
+        url = snapshot.values.get("current_url")
+        if url and url != "about:blank":
+            logger.info(f"🌐 Reopening {url}")
+            try:
+                await self.browser.navigate(url)
+            except Exception as e:
+                # The note below still tells planning not to trust old state
+                logger.warning(f"⚠️ Could not reopen {url}: {e}")
+        
+        messages = []
+        last = snapshot.values["messages"][-1] if snapshot.values.get("messages") else None
+        if "action" in snapshot.next and isinstance(last, AIMessage):
+            messages = [
+                ToolMessage(
+                    content="⚠️ Not run: the browser was restarted before this action executed",
+                    tool_call_id=call["id"],
+                    status="error"
+                )
+                for call in last.tool_calls
+            ]
+        messages.append(HumanMessage(content=(
+            "Note: the run was resumed in a new browser session. Element indexes "
+            "from earlier steps are stale - use only the page state that follows."
+        )))
+        
+        # As if the action node just ran, so observe_browser comes next
+        await self.graph.aupdate_state(config, {"messages": messages}, as_node="action")
+    
+    async def _stream_graph(self, graph_input: Optional[dict], config: dict, final_state: dict):
+        """
+        Run the graph, recording the fields needed for the final result.
+        
+        Streams per-node deltas rather than full state values, so the
+        message list (with base64 screenshots) isn't copied every step.
+        final_state is updated in place so progress survives a timeout.
+        """
+        stream_mode = ["updates", "messages"] if self.stream_tokens else ["updates"]
+        async for mode, data in self.graph.astream(graph_input, config=config, stream_mode=stream_mode):
+            if mode == "messages":
+                # Echo planning tokens as they arrive
+                chunk, metadata = data
+                if metadata.get("langgraph_node") == "planning" and isinstance(chunk.content, str):
+                    print(chunk.content, end="", flush=True)
+                continue
             
-            # Run graph with recursion limit
-            # Each step involves ~4 nodes: observe_browser → planning → action → update_history
-            # So recursion_limit needs to be at least (max_steps * 4) + buffer
-            config = {"recursion_limit": self.max_steps * 5}  # 5x for safety margin
-            final_state = None
-            async for event in self.graph.astream(initial_state, config=config, stream_mode="values"):
-                final_state = event
+            for delta in data.values():
+                if not delta:
+                    continue
                 # Log progress
-                if "messages" in event and event["messages"]:
-                    last_msg = event["messages"][-1]
-                    if isinstance(last_msg, ToolMessage):
-                        logger.info(f"🔧 Tool result: {last_msg.content[:100]}...")
-            
-            # Extract final result
-            if final_state:
-                # Look for done tool result
-                tool_messages = [m for m in final_state["messages"] if isinstance(m, ToolMessage)]
-                if tool_messages:
-                    last_result = tool_messages[-1].content
-                    
-                    logger.info(f"\n{'='*70}")
-                    logger.info("✅ TASK COMPLETE")
-                    logger.info(f"{'='*70}")
-                    logger.info(f"Result: {last_result}")
-                    logger.info(f"Steps taken: {final_state['step_number']}")
-                    logger.info(f"{'='*70}\n")
-                    
-                    return last_result
-            
-            # Fallback
-            return f"Reached max steps ({self.max_steps}). Progress: {final_state.get('memory', 'Unknown')}"
-            
-        finally:
-            await self.browser.close()
+                for msg in delta.get("messages", ()):
+                    if isinstance(msg, ToolMessage):
+                        logger.info(f"🔧 Tool result: {msg.content[:100]}...")
+                        final_state["messages"] = [msg]
+                for key in ("step_number", "memory"):
+                    if key in delta:
+                        final_state[key] = delta[key]
+    
+    def _initial_state(self) -> dict:
+        """Build the graph input for a fresh run"""
+        return {
+            "messages": [],
+            "last_ai_idx": -1,
+            "task": self.task,
+            "memory": "",
+            "step_number": 0,
+            "max_steps": self.max_steps,
+            "history_items": [],
+            "is_done": False,
+            "next_route": "action",
+            "current_url": "",
+            "current_title": "",
+            "elements": "",
+            "screenshot": None,
+            "screenshot_mime": "image/png",
+            "screenshot_hash": None,
+            "screenshot_msg_idxs": [],
+            "error": None
+        }
+    
+    def _extract_result(self, final_state: Optional[dict]) -> str:
+        """Extract the final result string from the last graph state"""
+        if final_state:
+            # Look for done tool result
+            tool_messages = [m for m in final_state["messages"] if isinstance(m, ToolMessage)]
+            if tool_messages:
+                last_result = tool_messages[-1].content
+                
+                logger.info(f"\n{'='*70}")
+                logger.info("✅ TASK COMPLETE")
+                logger.info(f"{'='*70}")
+                logger.info(f"Result: {last_result}")
+                logger.info(f"Steps taken: {final_state.get('step_number', 0)}")
+                logger.info(f"{'='*70}\n")
+                
+                return last_result
+        
+        # Fallback
+        memory = final_state.get('memory', 'Unknown') if final_state else 'Unknown'
+        return f"Reached max steps ({self.max_steps}). Progress: {memory}"
 
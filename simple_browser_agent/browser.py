@@ -2,30 +2,204 @@
 Simple browser session using CDP (Chrome DevTools Protocol).
 """
 import asyncio
-import json
 import logging
-import subprocess
+import string
 import time
 from typing import Optional, Dict, Any
 
+import orjson
 import websockets
 
 logger = logging.getLogger(__name__)
 
+# Elements the agent can interact with
+INTERACTIVE_TAGS = frozenset({'a', 'button', 'input', 'textarea', 'select'})
+INTERACTIVE_ROLES = frozenset({'button', 'link', 'checkbox', 'radio', 'tab', 'menuitem'})
+# Interactive elements listed per observation (more would overwhelm the LLM)
+MAX_ELEMENTS = 100
+# Attributes kept in element descriptions sent to the LLM
+KEEP_ATTRIBUTES = frozenset({'id', 'class', 'name', 'type', 'href', 'aria-label'})
+# V8 object group for resolved nodes, so they can be released in one call
+OBJECT_GROUP = 'sba'
+
+# Keyboard: key name aliases accepted by send_keys, virtual key codes for
+# special keys and CDP modifier bits
+KEY_ALIASES = {
+    'enter': 'Enter',
+    'tab': 'Tab',
+    'escape': 'Escape',
+    'esc': 'Escape',
+    'ctrl': 'Control',
+    'control': 'Control',
+    'alt': 'Alt',
+    'shift': 'Shift',
+    'meta': 'Meta',
+    'space': ' ',
+    'backspace': 'Backspace',
+    'delete': 'Delete',
+    'arrowup': 'ArrowUp',
+    'arrowdown': 'ArrowDown',
+    'arrowleft': 'ArrowLeft',
+    'arrowright': 'ArrowRight',
+}
+KEY_CODES = {
+    'Enter': 13,
+    'Tab': 9,
+    'Escape': 27,
+    'Backspace': 8,
+    'Delete': 46,
+    ' ': 32,
+    'ArrowUp': 38,
+    'ArrowDown': 40,
+    'ArrowLeft': 37,
+    'ArrowRight': 39,
+    'Control': 17,
+    'Alt': 18,
+    'Shift': 16,
+    'Meta': 91,
+}
+MODIFIER_BITS = {'Alt': 1, 'Control': 2, 'Meta': 4, 'Shift': 8}
+# (code, virtual key code) for letters and digits
+CHAR_KEYS = {
+    **{c: (f'Key{c.upper()}', ord(c.upper())) for c in string.ascii_letters},
+    **{d: (f'Digit{d}', ord(d)) for d in string.digits},
+}
+
+
+class CDPError(RuntimeError):
+    """Error response to a CDP command, carrying its JSON-RPC error code"""
+    
+    def __init__(self, error: dict):
+        super().__init__(f"CDP error: {error}")
+        self.code = error.get('code')
+
+
+def _collect_text(node: dict) -> list:
+    """Collect text node values under a CDP DOM node, in document order"""
+    texts = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if n.get('nodeType') == 3:  # TEXT_NODE
+            texts.append(n.get('nodeValue', ''))
+        stack.extend(reversed(n.get('children', ())))
+    return texts
+
 
 class SimpleBrowserSession:
     """A minimal browser controller using CDP"""
     
-    def __init__(self, headless: bool = False):
+    # Highlight overlay script (from browser-use); __DATA__ is replaced with
+    # the element boxes on each call, so only the data is serialized per step
+    _HIGHLIGHT_JS_TEMPLATE = """
+    (async function() {
+        // Remove existing highlights
+        const existing = document.getElementById('simple-agent-highlights');
+        if (existing) existing.remove();
+        
+        // Element boxes as a flat [index, x, y, width, height, ...] array
+        const boxes = __DATA__;
+        
+        // Static styles, shared by every highlight and label
+        const HIGHLIGHT_CSS = 'position:absolute;outline:2px solid #FF7F27;' +
+            'outline-offset:-2px;background:rgba(255,127,39,0.1);pointer-events:none;';
+        const LABEL_CSS = 'position:absolute;top:-20px;left:0;background-color:#FF7F27;' +
+            'color:white;padding:2px 6px;font-size:12px;font-family:monospace;' +
+            'font-weight:bold;border-radius:3px;white-space:nowrap;';
+        
+        // Create container
+        const container = document.createElement('div');
+        container.id = 'simple-agent-highlights';
+        container.style.cssText = `
+            position: absolute;
+            top: 0;
+            left: 0;
+            width: 100vw;
+            height: 100vh;
+            pointer-events: none;
+            z-index: 2147483647;
+            overflow: visible;
+        `;
+        
+        // Add highlight for each element
+        for (let i = 0; i < boxes.length; i += 5) {
+            const highlight = document.createElement('div');
+            highlight.style.cssText = HIGHLIGHT_CSS +
+                `left:${boxes[i + 1]}px;top:${boxes[i + 2]}px;` +
+                `width:${boxes[i + 3]}px;height:${boxes[i + 4]}px;`;
+            
+            // Add index label
+            const label = document.createElement('div');
+            label.textContent = boxes[i];
+            label.style.cssText = LABEL_CSS;
+            
+            highlight.appendChild(label);
+            container.appendChild(highlight);
+        }
+        
+        document.body.appendChild(container);
+        
+        // Resolve once the highlights are painted (two frames), with a timer
+        // fallback because background tabs do not run animation frames
+        await new Promise(resolve => {
+            requestAnimationFrame(() => requestAnimationFrame(resolve));
+            setTimeout(resolve, 100);
+        });
+        return { added: boxes.length / 5 };
+    })();
+    """
+    
+    # Resolves once the page scroll position has been stable for three frames
+    # (capped at 500ms; the timer also covers tabs that skip animation frames)
+    _SCROLL_SETTLE_JS = """
+    new Promise(resolve => {
+        let last = null, stable = 0;
+        (function check() {
+            const y = window.scrollY;
+            stable = y === last ? stable + 1 : 0;
+            last = y;
+            if (stable >= 3) resolve(true);
+            else requestAnimationFrame(check);
+        })();
+        setTimeout(() => resolve(false), 500);
+    })
+    """
+    
+    def __init__(
+        self,
+        headless: bool = False,
+        screenshot_format: str = 'webp',
+        screenshot_quality: int = 50,
+        screenshot_max_width: Optional[int] = 1024
+    ):
         self.headless = headless
+        # Screenshots go to the LLM on every step - let Chrome's encoder
+        # produce a compact image instead of re-encoding it in Python
+        self.screenshot_format = screenshot_format  # 'webp', 'jpeg' or 'png'
+        self.screenshot_quality = screenshot_quality  # 0-100, ignored for png
+        self.screenshot_max_width = screenshot_max_width  # Downscale wider viewports
         self.chrome_process = None
         self.ws = None
         self.cdp_url = None
         self.session_id = None
         self.target_id = None
         self.message_id = 0
+        # In-flight commands awaiting a response, resolved by the reader task.
+        # Lets several commands share the websocket concurrently.
+        self._pending = {}  # {message_id: Future}
+        self._reader_task = None
+        # Futures waiting for a CDP event, resolved by the reader task
+        self._event_waiters = {}  # {method: [(Future, frame_id or None), ...]}
+        # Viewport height for scrolling; cleared when the page is resized
+        self._viewport_height = None
         # Cache for mapping indexes to node IDs for proper clicking
-        self.element_cache = {}  # {index: node_id}
+        self.element_cache = []  # node_id per element index
+        # Remote object ids from DOM.resolveNode; only valid for the current
+        # document, so cleared on navigation and whenever node ids are reissued
+        self._object_ids = {}  # {node_id: objectId}
+        # Objects resolved into OBJECT_GROUP since it was last released. Kept
+        # apart from _object_ids, which is also cleared without a release
+        self._group_dirty = False
         
     async def start(self):
         """Start Chrome and connect via CDP"""
@@ -73,37 +247,45 @@ class SimpleBrowserSession:
             
         logger.info(f"Starting Chrome from: {chrome_path}")
         
-        self.chrome_process = subprocess.Popen(
-            chrome_args,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
+        self.chrome_process = await asyncio.create_subprocess_exec(
+            *chrome_args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
         )
         
-        # Wait for Chrome to start - try multiple times
+        # Wait for Chrome to start - poll with one client and a short
+        # exponential backoff (50ms, 100ms, ... capped at 500ms) so a fast
+        # start is picked up within tens of milliseconds
         import httpx
-        max_retries = 15
-        for i in range(max_retries):
-            await asyncio.sleep(1)
-            try:
-                async with httpx.AsyncClient() as client:
+        startup_timeout = 15.0
+        deadline = time.monotonic() + startup_timeout
+        attempt = 0
+        async with httpx.AsyncClient() as client:
+            while True:
+                attempt += 1
+                try:
                     response = await client.get(f'http://localhost:{port}/json/version', timeout=3.0)
                     data = response.json()
                     self.cdp_url = data['webSocketDebuggerUrl']
                     logger.info(f"✓ Connected to Chrome on port {port}")
                     break
-            except Exception as e:
-                if i == max_retries - 1:
-                    if self.chrome_process:
-                        self.chrome_process.terminate()
-                    raise RuntimeError(f"Failed to connect to Chrome after {max_retries} attempts: {e}")
-                logger.debug(f"Attempt {i+1}/{max_retries}: Waiting for Chrome...")
-                continue
+                except Exception as e:
+                    if time.monotonic() >= deadline:
+                        if self.chrome_process:
+                            self.chrome_process.terminate()
+                        raise RuntimeError(f"Failed to connect to Chrome after {attempt} attempts: {e}")
+                    logger.debug(f"Attempt {attempt}: Waiting for Chrome...")
+                await asyncio.sleep(min(0.05 * (2 ** (attempt - 1)), 0.5))
         
-        # Connect to WebSocket with larger message size limit
+        # Connect to WebSocket with larger message size limit. CDP runs over
+        # loopback, where compressing multi-MB snapshots costs more CPU than
+        # the bytes it saves, so permessage-deflate is disabled
         self.ws = await websockets.connect(
             self.cdp_url,
-            max_size=10 * 1024 * 1024  # 10MB limit
+            max_size=10 * 1024 * 1024,  # 10MB limit
+            compression=None
         )
+        self._reader_task = asyncio.create_task(self._read_messages())
         
         # Create a target (new page)
         result = await self._send_command('Target.createTarget', {
@@ -126,102 +308,213 @@ class SimpleBrowserSession:
         logger.info("Browser started successfully")
         
     async def _send_command(self, method: str, params: Optional[Dict] = None, session_id: Optional[str] = None) -> Any:
-        """Send a CDP command"""
+        """Send a CDP command and wait for its response"""
         self.message_id += 1
+        message_id = self.message_id
         message = {
-            'id': self.message_id,
+            'id': message_id,
             'method': method,
             'params': params or {}
         }
         
         if session_id:
             message['sessionId'] = session_id
-            
-        await self.ws.send(json.dumps(message))
         
-        # Wait for response
-        while True:
-            response = await self.ws.recv()
-            data = json.loads(response)
-            
-            if data.get('id') == self.message_id:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        try:
+            # Sent as text: Chrome's DevTools socket expects text frames
+            await self.ws.send(orjson.dumps(message).decode())
+            return await future
+        finally:
+            self._pending.pop(message_id, None)
+    
+    async def _read_messages(self):
+        """Reader task: route every CDP response to the command awaiting it"""
+        try:
+            async for raw in self.ws:
+                data = orjson.loads(raw)
+                if 'id' not in data:
+                    method = data.get('method')
+                    if method == 'Page.frameResized':
+                        self._viewport_height = None
+                    elif method == 'Page.frameNavigated':
+                        # Only a main-frame navigation replaces the document
+                        # the cached objects belong to; iframes (ads) do not
+                        if data['params']['frame']['id'] == self.target_id:
+                            self._object_ids.clear()
+                    # Event: wake (and drop) everyone waiting for it. Waiters
+                    # tied to a frame ignore the same event from other frames
+                    params = data.get('params', {})
+                    waiters = self._event_waiters.pop(method, ())
+                    event_frame = params.get('frameId') or params.get('frame', {}).get('id')
+                    for future, frame_id in waiters:
+                        if frame_id is not None and event_frame != frame_id:
+                            self._event_waiters.setdefault(method, []).append((future, frame_id))
+                        elif not future.done():
+                            future.set_result(params)
+                    continue
+                future = self._pending.get(data['id'])
+                if future is None or future.done():
+                    continue  # Response nobody is waiting for
                 if 'error' in data:
-                    raise RuntimeError(f"CDP error: {data['error']}")
-                return data.get('result', {})
+                    future.set_exception(CDPError(data['error']))
+                else:
+                    future.set_result(data.get('result', {}))
+        except Exception as e:
+            logger.debug(f"CDP reader stopped: {e}")
+        finally:
+            # Fail in-flight commands instead of leaving them hanging
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(RuntimeError("CDP connection closed"))
+            for waiters in self._event_waiters.values():
+                for future, _ in waiters:
+                    if not future.done():
+                        future.set_exception(RuntimeError("CDP connection closed"))
+    
+    def _expect_event(self, method: str, frame_id: Optional[str] = None) -> asyncio.Future:
+        """
+        Register interest in a CDP event and return a future for its params.
+        
+        Call this BEFORE sending the command that triggers the event, so a
+        fast event cannot arrive before anyone is listening.
+        
+        Args:
+            method: CDP event name, e.g. 'Page.loadEventFired'
+            frame_id: Only accept the event for this frame (its params' frameId,
+                or frame.id for Page.frameNavigated)
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._event_waiters.setdefault(method, []).append((future, frame_id))
+        return future
+    
+    def _expect_navigation(self):
+        """
+        Listen for a main-frame navigation before triggering an action.
+        
+        Returns:
+            (started, loaded) futures for _wait_for_navigation. Loads in
+            subframes such as ad iframes are ignored - the main frame's id is
+            the page's target id.
+        """
+        started = self._expect_event('Page.frameStartedLoading', frame_id=self.target_id)
+        loaded = self._expect_event('Page.loadEventFired')
+        return started, loaded
+    
+    def _forget_event(self, future: asyncio.Future):
+        """Unregister a future created by _expect_event"""
+        for waiters in self._event_waiters.values():
+            waiters[:] = [waiter for waiter in waiters if waiter[0] is not future]
+        future.cancel()
+    
+    async def _wait_for_event(self, future: asyncio.Future, timeout: float) -> Optional[Dict]:
+        """Wait for an expected event; returns its params, or None on timeout"""
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._forget_event(future)
+    
+    async def _wait_for_navigation(
+        self,
+        started: asyncio.Future,
+        loaded: asyncio.Future,
+        start_timeout: float = 0.5,
+        load_timeout: float = 5.0
+    ):
+        """
+        Wait for a navigation an action may have triggered.
+        
+        Returns as soon as the page has loaded, or after start_timeout if no
+        navigation began - instead of sleeping a fixed amount after every action.
+        
+        Args:
+            started: First future from _expect_navigation()
+            loaded: Second future from _expect_navigation()
+            start_timeout: How long to wait for a navigation to begin
+            load_timeout: Cap on how long to wait for the load event
+        """
+        if await self._wait_for_event(started, start_timeout) is not None:
+            await self._wait_for_event(loaded, load_timeout)
+        else:
+            self._forget_event(loaded)
                 
     async def navigate(self, url: str):
-        """Navigate to a URL"""
-        await self._send_command('Page.navigate', {'url': url}, session_id=self.session_id)
-        await asyncio.sleep(2)  # Wait for page load
+        """Navigate to a URL and wait for the page load event"""
+        loaded = self._expect_event('Page.loadEventFired')
+        result = await self._send_command('Page.navigate', {'url': url}, session_id=self.session_id)
+        if result.get('loaderId'):
+            await self._wait_for_event(loaded, timeout=5.0)
+        else:
+            # Same-document navigation (e.g. #fragment) fires no load event
+            self._forget_event(loaded)
         
     async def observe_browser_state(self) -> Dict[str, Any]:
         """Get current page state with interactive elements (browser-use approach)"""
         # Clear previous cache
-        self.element_cache = {}
+        self.element_cache = []
+        # DOM.getDocument reissues node ids - drop the old nodes' objects so
+        # V8 does not hold them for the rest of the page's lifetime
+        self._object_ids.clear()
+        release = []
+        if self._group_dirty:
+            self._group_dirty = False
+            release.append(self._send_command('Runtime.releaseObjectGroup', {
+                'objectGroup': OBJECT_GROUP
+            }, session_id=self.session_id))
         
-        # Get page info
-        result = await self._send_command('Target.getTargetInfo', 
-                                          {'targetId': self.target_id})
+        # Page info, full DOM tree, layout snapshot and the viewport used to
+        # scale the screenshot are independent - send them all at once, along
+        # with the release nothing else here waits on, and wait for the
+        # responses together
+        logger.info("📋 Fetching page info, DOM tree and DOM snapshot...")
+        result, dom_result, snapshot_result, viewport, *_ = await asyncio.gather(
+            self._send_command('Target.getTargetInfo', {'targetId': self.target_id}),
+            # BROWSER-USE APPROACH: Get full DOM tree using CDP
+            self._send_command('DOM.getDocument', {
+                'depth': -1,  # Get entire tree
+                'pierce': True  # Pierce through shadow DOM
+            }, session_id=self.session_id),
+            # Layout bounds for visibility checking AND positions. Bounds are
+            # always included; no computed styles are requested and paint
+            # order / extra DOM rects stay at their default (off), since none
+            # of them are read - a smaller payload to transfer and parse
+            self._send_command('DOMSnapshot.captureSnapshot', {
+                'computedStyles': []
+            }, session_id=self.session_id),
+            self._get_viewport(),
+            *release
+        )
         target_info = result['targetInfo']
-        
-        # BROWSER-USE APPROACH: Get full DOM tree using CDP
-        logger.info("📋 Fetching DOM tree...")
-        dom_result = await self._send_command('DOM.getDocument', {
-            'depth': -1,  # Get entire tree
-            'pierce': True  # Pierce through shadow DOM
-        }, session_id=self.session_id)
-        
         root_node = dom_result['root']
         
-        # Get computed styles for visibility checking AND bounds
-        logger.info("📋 Getting DOM snapshot for visibility and positions...")
-        snapshot_result = await self._send_command('DOMSnapshot.captureSnapshot', {
-            'computedStyles': ['display', 'visibility', 'opacity'],
-            'includePaintOrder': False,
-            'includeDOMRects': True  # ✨ This gives us element positions!
-        }, session_id=self.session_id)
-        
         # Build lookup for visibility AND positions
         visibility_map = {}
-        position_map = {}  # ✨ NEW: Store element positions
+        position_map = {}  # ✨ NEW: Store element positions as (x, y, width, height)
         if snapshot_result and 'documents' in snapshot_result:
             for doc in snapshot_result['documents']:
                 nodes = doc.get('nodes', {})
                 layout = doc.get('layout', {})
-                node_index = layout.get('nodeIndex', [])
-                bounds = layout.get('bounds', [])
                 backend_node_ids = nodes.get('backendNodeId', [])
+                n_backend = len(backend_node_ids)
                 
-                # FIX: The layout.nodeIndex contains indices into the nodes arrays
-                # We need to map layout index -> snapshot node index -> backend node ID
-                for i, snapshot_idx in enumerate(node_index):
-                    # snapshot_idx is the index into the nodes.backendNodeId array
-                    if snapshot_idx >= len(backend_node_ids):
+                # layout.nodeIndex[i] is the index into the nodes arrays of the
+                # node whose layout box is bounds[i] ([x, y, width, height])
+                for snapshot_idx, bound in zip(layout.get('nodeIndex', ()), layout.get('bounds', ())):
+                    if snapshot_idx >= n_backend:
                         continue
-                    
                     backend_node_id = backend_node_ids[snapshot_idx]
+                    try:
+                        x, y, width, height, *_ = bound
+                    except (TypeError, ValueError):
+                        continue
                     
                     # Simple visibility check based on bounds
-                    is_visible = True
-                    if i < len(bounds):
-                        bound = bounds[i]
-                        # Check if element has any size
-                        if isinstance(bound, list) and len(bound) >= 6:
-                            x = bound[0]
-                            y = bound[1]
-                            width = bound[2]
-                            height = bound[3]
-                            is_visible = width > 0 and height > 0
-                            
-                            # ✨ Store position using backendNodeId
-                            if is_visible:
-                                position_map[backend_node_id] = {
-                                    'x': x,
-                                    'y': y,
-                                    'width': width,
-                                    'height': height
-                                }
-                    
+                    is_visible = width > 0 and height > 0
+                    if is_visible:
+                        position_map[backend_node_id] = (x, y, width, height)
                     visibility_map[backend_node_id] = is_visible
                 
                 logger.debug(f"📊 Position map has {len(position_map)} elements with valid positions")
@@ -229,63 +522,44 @@ class SimpleBrowserSession:
         # Extract interactive elements
         interactive_elements = []
         
-        def traverse_dom(node, depth=0):
-            """Recursively traverse DOM and collect interactive elements"""
-            if depth > 50:  # Prevent infinite loops
-                return
-                
+        # Iterative pre-order walk (explicit stack instead of recursion).
+        # Children are pushed in reverse so they are visited in document order.
+        # Stops once MAX_ELEMENTS are found - later elements would be dropped anyway.
+        stack = [(root_node, 0)]
+        while stack and len(interactive_elements) < MAX_ELEMENTS:
+            node, depth = stack.pop()
+            if depth > 50:  # Prevent runaway depth
+                continue
+            
             node_id = node.get('nodeId')
             backend_node_id = node.get('backendNodeId')
             node_type = node.get('nodeType', 0)
+            children = node.get('children', ())
             
             # Skip non-element nodes and invisible elements
-            if node_type != 1:  # Not an ELEMENT_NODE
-                # Process children
-                for child in node.get('children', []):
-                    traverse_dom(child, depth + 1)
-                return
-            
-            # Check if visible using backendNodeId
+            # (still traverse their children)
             local_name = node.get('localName', '').lower()
-            if (backend_node_id not in visibility_map or
-                    not visibility_map.get(backend_node_id, False)):
-                # Still traverse children even if parent invisible
-                for child in node.get('children', []):
-                    traverse_dom(child, depth + 1)
-                return
+            if node_type != 1 or not visibility_map.get(backend_node_id, False):
+                stack.extend((child, depth + 1) for child in reversed(children))
+                continue
             
             # Check if interactive
-            interactive_tags = {'a', 'button', 'input', 'textarea', 'select'}
-            attributes = {}
-            if 'attributes' in node:
-                attrs = node['attributes']
-                for i in range(0, len(attrs), 2):
-                    if i + 1 < len(attrs):
-                        attributes[attrs[i]] = attrs[i + 1]
+            # CDP sends attributes as a flat [name, value, name, value, ...] list
+            attrs = iter(node.get('attributes', ()))
+            attributes = dict(zip(attrs, attrs))
             
             role = attributes.get('role', '')
             onclick = 'onclick' in attributes
             
             is_interactive = (
-                local_name in interactive_tags or
-                role in ['button', 'link', 'checkbox', 'radio', 'tab', 'menuitem'] or
+                local_name in INTERACTIVE_TAGS or
+                role in INTERACTIVE_ROLES or
                 onclick
             )
             
             if is_interactive:
-                # Build element description
-                text = ''
-                # Get text content from children
-                def get_text(n):
-                    texts = []
-                    if n.get('nodeType') == 3:  # TEXT_NODE
-                        texts.append(n.get('nodeValue', ''))
-                    for child in n.get('children', []):
-                        texts.extend(get_text(child))
-                    return texts
-                
-                text_parts = get_text(node)
-                text = ' '.join(text_parts).strip()[:100]
+                # Build element description from text content of the subtree
+                text = ' '.join(_collect_text(node)).strip()[:100]
                 
                 # Fallback to attributes
                 if not text:
@@ -296,6 +570,11 @@ class SimpleBrowserSession:
                            attributes.get('alt') or
                            f'{local_name} element')
                 
+                position = position_map.get(backend_node_id)
+                if position is not None:
+                    x, y, width, height = position
+                    position = {'x': x, 'y': y, 'width': width, 'height': height}
+                
                 element_info = {
                     'node_id': node_id,
                     'backend_node_id': backend_node_id,
@@ -303,68 +582,44 @@ class SimpleBrowserSession:
                     'text': text[:80],  # Limit text length
                     'attributes': {
                         k: v[:50] for k, v in attributes.items()
-                        if k in ['id', 'class', 'name', 'type',
-                                 'href', 'aria-label']
+                        if k in KEEP_ATTRIBUTES
                     },
-                    'position': position_map.get(backend_node_id)
+                    'position': position
                 }
                 
                 interactive_elements.append(element_info)
             
-            # Process children (including shadow roots)
-            for child in node.get('children', []):
-                traverse_dom(child, depth + 1)
-            
-            # Process shadow roots
-            if 'shadowRoots' in node:
-                for shadow in node['shadowRoots']:
-                    traverse_dom(shadow, depth + 1)
-        
-        # Start traversal
-        traverse_dom(root_node)
-        
-        # Limit to first 100 elements to avoid overwhelming LLM
-        interactive_elements = interactive_elements[:100]
+            # Process children, then shadow roots (pushed first so they pop last)
+            stack.extend((shadow, depth + 1) for shadow in reversed(node.get('shadowRoots', ())))
+            stack.extend((child, depth + 1) for child in reversed(children))
         
         logger.info(f"📋 Found {len(interactive_elements)} interactive elements")
         
         # FALLBACK: Get positions using DOM.getBoxModel for elements without positions
-        elements_without_positions = sum(1 for elem in interactive_elements if elem.get('position') is None)
-        if elements_without_positions > 0:
-            logger.info(f"🔧 Fetching positions for {elements_without_positions} elements using DOM.getBoxModel...")
-            for elem in interactive_elements:
-                if elem.get('position') is None and elem.get('node_id'):
-                    try:
-                        box_result = await self._send_command('DOM.getBoxModel', {
-                            'nodeId': elem['node_id']
-                        }, session_id=self.session_id)
-                        
-                        if 'model' in box_result and 'content' in box_result['model']:
-                            content = box_result['model']['content']
-                            # content is [x1, y1, x2, y2, x3, y3, x4, y4] for the 4 corners
-                            x = min(content[0], content[2], content[4], content[6])
-                            y = min(content[1], content[3], content[5], content[7])
-                            width = max(content[0], content[2], content[4], content[6]) - x
-                            height = max(content[1], content[3], content[5], content[7]) - y
-                            
-                            if width > 0 and height > 0:
-                                elem['position'] = {
-                                    'x': x,
-                                    'y': y,
-                                    'width': width,
-                                    'height': height
-                                }
-                    except Exception as e:
-                        logger.debug(f"Failed to get box model for element: {e}")
-            
-            elements_with_positions = sum(1 for elem in interactive_elements if elem.get('position') is not None)
+        missing = [elem for elem in interactive_elements
+                   if elem['position'] is None and elem['node_id']]
+        if missing:
+            logger.info(f"🔧 Fetching positions for {len(missing)} elements using DOM.getBoxModel...")
+            # Requests are multiplexed, so all box models are fetched in
+            # parallel - one round-trip instead of one per element
+            positions = await asyncio.gather(
+                *(self._get_box_position(elem['node_id']) for elem in missing)
+            )
+            still_missing = 0
+            for elem, position in zip(missing, positions):
+                if position is None:
+                    still_missing += 1
+                else:
+                    elem['position'] = position
+            
+            elements_with_positions = len(interactive_elements) - still_missing
             logger.info(f"✅ Now {elements_with_positions}/{len(interactive_elements)} elements have positions")
         
         # Build element descriptions with indexes
         element_lines = []
         for idx, elem in enumerate(interactive_elements):
             # Cache node_id for clicking
-            self.element_cache[idx] = elem['node_id']
+            self.element_cache.append(elem['node_id'])
             
             # Format element
             tag = elem['tag']
@@ -384,13 +639,11 @@ class SimpleBrowserSession:
         # HIGHLIGHT ELEMENTS ON PAGE (browser-use approach!)
         if interactive_elements:
             await self._highlight_elements(interactive_elements)
-            # Wait briefly for highlights to render
-            await asyncio.sleep(0.2)
         
         # AUTO-CAPTURE SCREENSHOT for LLM vision (after highlighting!)
         screenshot_b64 = None
         try:
-            screenshot_b64 = await self.take_screenshot()
+            screenshot_b64 = await self.take_screenshot(viewport=viewport)
         except Exception as e:
             logger.warning(f"Screenshot capture failed: {e}")
         
@@ -399,9 +652,53 @@ class SimpleBrowserSession:
             'title': target_info['title'],
             'elements': elements_text,  # Back to elements list
             'screenshot_available': screenshot_b64 is not None,
-            'screenshot': screenshot_b64
+            'screenshot': screenshot_b64,
+            'screenshot_mime': f'image/{self.screenshot_format}'
         }
     
+    async def _get_box_position(self, node_id: int) -> Optional[Dict[str, float]]:
+        """Get an element's bounding box via DOM.getBoxModel (None if unavailable)"""
+        try:
+            box_result = await self._send_command('DOM.getBoxModel', {
+                'nodeId': node_id
+            }, session_id=self.session_id)
+        except Exception as e:
+            logger.debug(f"Failed to get box model for element: {e}")
+            return None
+        
+        if 'model' not in box_result or 'content' not in box_result['model']:
+            return None
+        
+        content = box_result['model']['content']
+        # content is [x1, y1, x2, y2, x3, y3, x4, y4] for the 4 corners
+        x = min(content[0], content[2], content[4], content[6])
+        y = min(content[1], content[3], content[5], content[7])
+        width = max(content[0], content[2], content[4], content[6]) - x
+        height = max(content[1], content[3], content[5], content[7]) - y
+        
+        if width > 0 and height > 0:
+            return {
+                'x': x,
+                'y': y,
+                'width': width,
+                'height': height
+            }
+        return None
+    
+    async def _resolve_object_id(self, node_id: int) -> Optional[str]:
+        """Get the remote object id for a node, reusing an earlier DOM.resolveNode"""
+        object_id = self._object_ids.get(node_id)
+        if object_id is None:
+            resolved = await self._send_command('DOM.resolveNode', {
+                'nodeId': node_id,
+                'objectGroup': OBJECT_GROUP
+            }, session_id=self.session_id)
+            if 'object' not in resolved:
+                return None
+            object_id = self._object_ids[node_id] = resolved['object']['objectId']
+            self._group_dirty = True
+        return object_id
+    
     async def _highlight_elements(self, elements: list):
         """Highlight interactive elements on the page with orange boxes and index numbers
         
@@ -410,97 +707,35 @@ class SimpleBrowserSession:
         """
         try:
             # Build elements data for JavaScript using pre-computed positions
-            elements_data = []
+            # Flat [index, x, y, width, height, ...] list - a much smaller
+            # payload than one dict per element
+            boxes = []
             for idx, elem in enumerate(elements):
                 # ✨ BROWSER-USE APPROACH: Use position from DOM snapshot
                 position = elem.get('position')
                 
                 if position and position['width'] > 0 and position['height'] > 0:
-                    elements_data.append({
-                        'index': idx,
-                        'x': position['x'],
-                        'y': position['y'],
-                        'width': position['width'],
-                        'height': position['height']
-                    })
+                    boxes += (idx, position['x'], position['y'],
+                              position['width'], position['height'])
                 else:
                     # Element has no valid position (off-screen or hidden)
                     logger.debug(f"Element {idx} has no valid position - skipping highlight")
             
-            if not elements_data:
+            if not boxes:
                 logger.warning("⚠️ No elements with valid positions to highlight")
                 return
             
-            logger.info(f"✨ Highlighting {len(elements_data)}/{len(elements)} elements on page")
+            logger.info(f"✨ Highlighting {len(boxes) // 5}/{len(elements)} elements on page")
             
-            # Inject highlighting script (from browser-use)
-            script = f"""
-            (function() {{
-                // Remove existing highlights
-                const existing = document.getElementById('simple-agent-highlights');
-                if (existing) existing.remove();
-                
-                // Element data
-                const elements = {json.dumps(elements_data)};
-                
-                // Create container
-                const container = document.createElement('div');
-                container.id = 'simple-agent-highlights';
-                container.style.cssText = `
-                    position: absolute;
-                    top: 0;
-                    left: 0;
-                    width: 100vw;
-                    height: 100vh;
-                    pointer-events: none;
-                    z-index: 2147483647;
-                    overflow: visible;
-                `;
-                
-                // Add highlight for each element
-                elements.forEach(el => {{
-                    const highlight = document.createElement('div');
-                    highlight.style.cssText = `
-                        position: absolute;
-                        left: ${{el.x}}px;
-                        top: ${{el.y}}px;
-                        width: ${{el.width}}px;
-                        height: ${{el.height}}px;
-                        outline: 2px solid #FF7F27;
-                        outline-offset: -2px;
-                        background: rgba(255, 127, 39, 0.1);
-                        pointer-events: none;
-                    `;
-                    
-                    // Add index label
-                    const label = document.createElement('div');
-                    label.textContent = el.index;
-                    label.style.cssText = `
-                        position: absolute;
-                        top: -20px;
-                        left: 0;
-                        background-color: #FF7F27;
-                        color: white;
-                        padding: 2px 6px;
-                        font-size: 12px;
-                        font-family: monospace;
-                        font-weight: bold;
-                        border-radius: 3px;
-                        white-space: nowrap;
-                    `;
-                    
-                    highlight.appendChild(label);
-                    container.appendChild(highlight);
-                }});
-                
-                document.body.appendChild(container);
-                return {{ added: elements.length }};
-            }})();
-            """
+            # Inject highlighting script with this step's element boxes
+            script = self._HIGHLIGHT_JS_TEMPLATE.replace(
+                '__DATA__', orjson.dumps(boxes).decode()
+            )
             
             result = await self._send_command('Runtime.evaluate', {
                 'expression': script,
-                'returnByValue': True
+                'returnByValue': True,
+                'awaitPromise': True  # Returns after the highlights are painted
             }, session_id=self.session_id)
             
             if result and 'result' in result and 'value' in result['result']:
@@ -512,7 +747,7 @@ class SimpleBrowserSession:
         
     async def click(self, index: int) -> bool:
         """Click an element by index using CDP (browser-use approach)"""
-        if index not in self.element_cache:
+        if not 0 <= index < len(self.element_cache):
             logger.error(f"Element index {index} not found in cache")
             return False
         
@@ -525,7 +760,6 @@ class SimpleBrowserSession:
                 await self._send_command('DOM.scrollIntoViewIfNeeded', {
                     'nodeId': node_id
                 }, session_id=self.session_id)
-                await asyncio.sleep(0.3)  # Wait for scroll animation
                 logger.debug(f"Scrolled element [{index}] into view")
             except Exception as scroll_err:
                 # Fallback: use JavaScript scrollIntoView
@@ -535,7 +769,7 @@ class SimpleBrowserSession:
                         (function() {{
                             const node = document.querySelector('[data-node-id="{node_id}"]');
                             if (node) {{
-                                node.scrollIntoView({{block: 'center', behavior: 'smooth'}});
+                                node.scrollIntoView({{block: 'center', behavior: 'instant'}});
                                 return true;
                             }}
                             return false;
@@ -543,7 +777,6 @@ class SimpleBrowserSession:
                     ''',
                     'returnByValue': True
                 }, session_id=self.session_id)
-                await asyncio.sleep(0.3)
             
             # Get the box model for the element (AFTER scrolling!)
             box_result = await self._send_command('DOM.getBoxModel', {
@@ -559,26 +792,22 @@ class SimpleBrowserSession:
             x = (content[0] + content[4]) / 2
             y = (content[1] + content[5]) / 2
             
-            # Dispatch mouse events
-            await self._send_command('Input.dispatchMouseEvent', {
-                'type': 'mousePressed',
-                'x': x,
-                'y': y,
-                'button': 'left',
-                'clickCount': 1
-            }, session_id=self.session_id)
-            
-            await asyncio.sleep(0.1)
+            # Listen before clicking so a fast navigation is not missed
+            started, loaded = self._expect_navigation()
             
-            await self._send_command('Input.dispatchMouseEvent', {
-                'type': 'mouseReleased',
-                'x': x,
-                'y': y,
-                'button': 'left',
-                'clickCount': 1
-            }, session_id=self.session_id)
+            # Dispatch mouse events. CDP handles a session's commands in order,
+            # so the release is sent without waiting for the press response
+            mouse = {'x': x, 'y': y, 'button': 'left', 'clickCount': 1}
+            await asyncio.gather(
+                self._send_command('Input.dispatchMouseEvent', {
+                    'type': 'mousePressed', **mouse
+                }, session_id=self.session_id),
+                self._send_command('Input.dispatchMouseEvent', {
+                    'type': 'mouseReleased', **mouse
+                }, session_id=self.session_id)
+            )
             
-            await asyncio.sleep(1)  # Wait for action effect
+            await self._wait_for_navigation(started, loaded)
             logger.info(f"✓ Clicked element [{index}] at ({x}, {y})")
             return True
             
@@ -588,7 +817,7 @@ class SimpleBrowserSession:
         
     async def input_text(self, index: int, text: str) -> bool:
         """Input text into an element using CDP and node_id from cache"""
-        if index not in self.element_cache:
+        if not 0 <= index < len(self.element_cache):
             logger.error(f"Element index {index} not found in cache")
             return False
         
@@ -600,33 +829,22 @@ class SimpleBrowserSession:
                 'nodeId': node_id
             }, session_id=self.session_id)
             
-            await asyncio.sleep(0.1)
-            
-            # Clear existing text first (select all + delete)
-            await self._send_command('Input.dispatchKeyEvent', {
-                'type': 'keyDown',
-                'key': 'a',
-                'code': 'KeyA',
-                'modifiers': 2  # Control/Command modifier
+            # Clear existing text in place (no select-all key round-trips)
+            await self._send_command('Runtime.callFunctionOn', {
+                'objectId': await self._resolve_object_id(node_id),
+                'functionDeclaration': (
+                    'function() {'
+                    ' if ("value" in this) { this.value = ""; }'
+                    ' else if (this.isContentEditable) { this.textContent = ""; }'
+                    ' }'
+                )
             }, session_id=self.session_id)
             
-            await self._send_command('Input.dispatchKeyEvent', {
-                'type': 'keyUp',
-                'key': 'a',
-                'code': 'KeyA',
-                'modifiers': 2
+            # Insert the whole string with one command instead of one per character
+            await self._send_command('Input.insertText', {
+                'text': text
             }, session_id=self.session_id)
             
-            await asyncio.sleep(0.05)
-            
-            # Type the new text character by character
-            for char in text:
-                await self._send_command('Input.dispatchKeyEvent', {
-                    'type': 'char',
-                    'text': char
-                }, session_id=self.session_id)
-                await asyncio.sleep(0.02)  # Small delay between characters
-            
             await asyncio.sleep(0.2)
             logger.info(f"✓ Typed '{text}' into element [{index}]")
             return True
@@ -635,9 +853,17 @@ class SimpleBrowserSession:
             logger.error(f"Input text failed for element [{index}]: {e}")
             return False
         
-    async def extract_content(self) -> str:
-        """Extract page text content"""
+    async def extract_content(self, max_chars: Optional[int] = None) -> str:
+        """
+        Extract page text content.
+        
+        Args:
+            max_chars: Cut the text to this many characters in the page, so
+                text that would be discarded is never sent over the websocket
+        """
         js = "document.body.innerText"
+        if max_chars is not None:
+            js += f".slice(0, {int(max_chars)})"
         result = await self._send_command('Runtime.evaluate', {
             'expression': js,
             'returnByValue': True
@@ -647,27 +873,13 @@ class SimpleBrowserSession:
     
     async def send_keys(self, keys: str):
         """Send keyboard keys using CDP Input.dispatchKeyEvent"""
-        # Normalize key names
-        key_aliases = {
-            'enter': 'Enter',
-            'tab': 'Tab',
-            'escape': 'Escape',
-            'esc': 'Escape',
-            'ctrl': 'Control',
-            'control': 'Control',
-            'alt': 'Alt',
-            'shift': 'Shift',
-            'meta': 'Meta',
-            'space': ' ',
-            'backspace': 'Backspace',
-            'delete': 'Delete',
-            'arrowup': 'ArrowUp',
-            'arrowdown': 'ArrowDown',
-            'arrowleft': 'ArrowLeft',
-            'arrowright': 'ArrowRight',
-        }
+        normalized = KEY_ALIASES.get(keys.lower(), keys)  # Normalize key names
         
-        normalized = key_aliases.get(keys.lower(), keys)
+        # Only Enter (alone or with modifiers) can submit a form and navigate;
+        # other keys return without waiting for a navigation
+        submits = normalized.split('+')[-1].lower() == 'enter'
+        if submits:
+            started, loaded = self._expect_navigation()
         
         # Handle key combinations like "Control+A"
         if '+' in normalized:
@@ -677,9 +889,8 @@ class SimpleBrowserSession:
             
             # Calculate modifier bitmask
             modifier_value = 0
-            modifier_map = {'Alt': 1, 'Control': 2, 'Meta': 4, 'Shift': 8}
             for mod in modifiers:
-                modifier_value |= modifier_map.get(mod, 0)
+                modifier_value |= MODIFIER_BITS.get(mod, 0)
             
             # Press modifiers
             for mod in modifiers:
@@ -697,45 +908,34 @@ class SimpleBrowserSession:
             await self._dispatch_key_event('keyDown', normalized)
             await self._dispatch_key_event('keyUp', normalized)
         
-        await asyncio.sleep(0.3)  # Wait for key effect
+        if submits:
+            await self._wait_for_navigation(started, loaded)
     
     async def _dispatch_key_event(self, event_type: str, key: str, modifiers: int = 0):
         """Dispatch a keyboard event via CDP"""
-        # Get key code
-        key_codes = {
-            'Enter': 13,
-            'Tab': 9,
-            'Escape': 27,
-            'Backspace': 8,
-            'Delete': 46,
-            ' ': 32,
-            'ArrowUp': 38,
-            'ArrowDown': 40,
-            'ArrowLeft': 37,
-            'ArrowRight': 39,
-            'Control': 17,
-            'Alt': 18,
-            'Shift': 16,
-            'Meta': 91,
-        }
-        
-        params = {
-            'type': event_type,
-        }
-        
-        # Add key info
-        if key in key_codes:
-            params['key'] = key
-            params['code'] = key
-            params['windowsVirtualKeyCode'] = key_codes[key]
-            params['nativeVirtualKeyCode'] = key_codes[key]
+        key_code = KEY_CODES.get(key)
+        if key_code is not None:
+            params = {
+                'type': event_type,
+                'key': key,
+                'code': key,
+                'windowsVirtualKeyCode': key_code,
+                'nativeVirtualKeyCode': key_code
+            }
         else:
             # Regular character
-            params['key'] = key
-            params['code'] = f'Key{key.upper()}' if len(key) == 1 else key
-            params['text'] = key
-            params['unmodifiedText'] = key
-            params['windowsVirtualKeyCode'] = ord(key.upper()) if len(key) == 1 else 0
+            char_key = CHAR_KEYS.get(key)
+            if char_key is None:
+                char_key = (f'Key{key.upper()}', ord(key.upper())) if len(key) == 1 else (key, 0)
+            code, key_code = char_key
+            params = {
+                'type': event_type,
+                'key': key,
+                'code': code,
+                'text': key,
+                'unmodifiedText': key,
+                'windowsVirtualKeyCode': key_code
+            }
         
         if modifiers:
             params['modifiers'] = modifiers
@@ -743,13 +943,36 @@ class SimpleBrowserSession:
         await self._send_command('Input.dispatchKeyEvent', params, session_id=self.session_id)
     
     async def scroll(self, down: bool = True, pages: float = 1.0):
-        """Scroll the page using mouse wheel"""
-        # Get viewport height
-        try:
-            metrics = await self._send_command('Page.getLayoutMetrics', session_id=self.session_id)
-            viewport_height = metrics.get('cssVisualViewport', {}).get('clientHeight', 1000)
-        except:
-            viewport_height = 1000  # Fallback
+        """Scroll the page by whole viewports
+        
+        Scrolls the document in-page with one Runtime.evaluate. Pages whose
+        content lives in an inner scroll container (the document itself
+        doesn't move) fall back to a mouse wheel event over the page.
+        """
+        direction = 1 if down else -1
+        result = await self._send_command('Runtime.evaluate', {
+            'expression': (
+                '(function() {'
+                ' const y = window.scrollY;'
+                f' window.scrollBy({{top: {direction * pages} * window.innerHeight, behavior: "instant"}});'
+                ' return window.scrollY !== y;'
+                ' })()'
+            ),
+            'returnByValue': True
+        }, session_id=self.session_id)
+        if result.get('result', {}).get('value'):
+            return
+        
+        # FALLBACK: mouse wheel over the page, sized by the viewport height
+        # (cached until the page is resized)
+        viewport_height = self._viewport_height
+        if viewport_height is None:
+            try:
+                metrics = await self._send_command('Page.getLayoutMetrics', session_id=self.session_id)
+                viewport_height = metrics['cssVisualViewport']['clientHeight']
+                self._viewport_height = viewport_height
+            except Exception:
+                viewport_height = 1000  # Fallback (not cached)
         
         # Calculate scroll amount
         pixels = int(pages * viewport_height)
@@ -765,22 +988,101 @@ class SimpleBrowserSession:
             'deltaY': pixels,
         }, session_id=self.session_id)
         
-        await asyncio.sleep(0.5)  # Wait for scroll to complete
-    
-    async def take_screenshot(self) -> str:
-        """Take a screenshot and return base64 encoded image"""
-        result = await self._send_command('Page.captureScreenshot', {
-            'format': 'jpeg',
-            'quality': 60,
+        # Wait for the scroll to finish instead of a fixed 500ms
+        await self._send_command('Runtime.evaluate', {
+            'expression': self._SCROLL_SETTLE_JS,
+            'awaitPromise': True
         }, session_id=self.session_id)
+    
+    async def _get_viewport(self) -> Optional[Dict[str, Any]]:
+        """Get the CSS visual viewport (scroll offset and size), or None if unavailable"""
+        try:
+            metrics = await self._send_command('Page.getLayoutMetrics', session_id=self.session_id)
+            return metrics['cssVisualViewport']
+        except Exception as e:
+            logger.debug(f"Could not get viewport for screenshot scaling: {e}")
+            return None
+    
+    async def take_screenshot(
+        self,
+        quality: Optional[int] = None,
+        viewport: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Take a screenshot and return base64 encoded image
+        
+        Args:
+            quality: Encoder quality (0-100) for this capture; defaults to
+                screenshot_quality. Ignored for png.
+            viewport: cssVisualViewport already fetched by the caller; saves
+                a Page.getLayoutMetrics round-trip when downscaling
+        """
+        params = {'format': self.screenshot_format}
+        if self.screenshot_format != 'png':
+            params['quality'] = self.screenshot_quality if quality is None else quality
+        
+        # Downscale wide viewports in Chrome via a scaled viewport clip
+        if self.screenshot_max_width:
+            if viewport is None:
+                viewport = await self._get_viewport()
+            if viewport and viewport.get('clientWidth'):
+                scale = self.screenshot_max_width / viewport['clientWidth']
+                if scale < 1:
+                    params['clip'] = {
+                        'x': viewport['pageX'],
+                        'y': viewport['pageY'],
+                        'width': viewport['clientWidth'],
+                        'height': viewport['clientHeight'],
+                        'scale': scale
+                    }
+        
+        try:
+            result = await self._send_command('Page.captureScreenshot', params, session_id=self.session_id)
+        except CDPError as e:
+            # Older Chrome builds reject webp as an invalid parameter - switch
+            # to jpeg for the session. Any other failure is not about the format.
+            if self.screenshot_format != 'webp' or e.code != -32602:
+                raise
+            logger.warning(f"⚠️ WebP screenshots not supported, falling back to JPEG: {e}")
+            self.screenshot_format = params['format'] = 'jpeg'
+            result = await self._send_command('Page.captureScreenshot', params, session_id=self.session_id)
         
         return result['data']  # Already base64 encoded
         
+    async def reset(self):
+        """
+        Return the running browser to a clean state for the next task.
+        
+        Blanks the page, clears cookies and closes any extra tabs, keeping the
+        Chrome process, websocket and session - far cheaper than close() +
+        start() when running several tasks back to back.
+        """
+        result = await self._send_command('Target.getTargets')
+        await asyncio.gather(
+            self.navigate('about:blank'),
+            self._send_command('Network.clearBrowserCookies', session_id=self.session_id),
+            *(
+                self._send_command('Target.closeTarget', {'targetId': target['targetId']})
+                for target in result.get('targetInfos', [])
+                if target['type'] == 'page' and target['targetId'] != self.target_id
+            )
+        )
+        self.element_cache = []
+        self._object_ids.clear()
+        logger.info("🔄 Browser reset")
+        
     async def close(self):
         """Close browser"""
         if self.ws:
             await self.ws.close()
-        if self.chrome_process:
+        if self._reader_task:
+            await self._reader_task
+        if self.chrome_process and self.chrome_process.returncode is None:
+            # Wait for Chrome to exit without blocking the event loop
             self.chrome_process.terminate()
-            self.chrome_process.wait()
+            try:
+                await asyncio.wait_for(self.chrome_process.wait(), timeout=5.0)
+            except asyncio.TimeoutError:
+                logger.warning("Chrome did not exit after terminate, killing it")
+                self.chrome_process.kill()
+                await self.chrome_process.wait()
 
@@ -0,0 +1,142 @@
+"""
+Response cache for LLM planning calls.
+
+Deterministic runs (temperature=0, replays, tests) send identical prompts
+step after step. This module hashes the model, messages and tool signatures
+and returns the stored AIMessage on a hit instead of calling the LLM again.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from rate_limiter import completion_limit, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCache:
+    """In-memory LRU cache of LLM responses keyed by a SHA-256 prompt hash"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # {key: {"content": ..., "tool_calls": ...}}
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _message_fields(message: BaseMessage) -> dict:
+        """
+        The parts of a message that determine the LLM's answer.
+        
+        Message ids (a fresh uuid from add_messages on every run) and tool
+        call ids are left out, so the same prompt hashes the same across runs.
+        """
+        return {
+            "type": message.type,
+            "content": message.content,
+            "tool_calls": [
+                {"name": call["name"], "args": call["args"]}
+                for call in getattr(message, "tool_calls", None) or []
+            ]
+        }
+    
+    @staticmethod
+    def make_key(model: str, messages: list, tools_sig: list) -> str:
+        """Hash (model, message roles/contents/tool calls, sorted tool signatures) into a cache key"""
+        blob = json.dumps(
+            {
+                "model": model,
+                "messages": [LLMCache._message_fields(m) for m in messages],
+                "tools": sorted(tools_sig),
+            },
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[AIMessage]:
+        """Return the cached response for key, or None on miss"""
+        async with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return AIMessage(content=entry["content"], tool_calls=entry["tool_calls"])
+
+    async def put(self, key: str, response: AIMessage):
+        """Store a response, evicting the least recently used entry if full"""
+        async with self._lock:
+            self._entries[key] = {
+                "content": response.content,
+                "tool_calls": response.tool_calls
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+async def cached_ainvoke(
+    llm,
+    messages: list,
+    tools_sig: list,
+    temperature: Optional[float],
+    cache: Optional[LLMCache],
+    model: str = "",
+    stream: bool = False,
+    limiter=None
+) -> AIMessage:
+    """
+    Call llm.ainvoke(messages), serving the response from cache when possible.
+
+    Caching only applies to deterministic calls (temperature == 0). With no
+    cache or a sampling temperature the LLM is always called.
+
+    Args:
+        llm: LangChain chat model (optionally with tools bound)
+        messages: Messages to send
+        tools_sig: Strings identifying the tools bound to the model
+        temperature: Sampling temperature of the model
+        cache: LLMCache instance, or None to disable caching
+        model: Model/deployment name (part of the cache key)
+        stream: Stream the response with astream instead of ainvoke
+        limiter: Optional AsyncRateLimiter to pace calls that reach the LLM
+
+    Returns:
+        The LLM's AIMessage response
+    """
+    if cache is None or temperature is None or temperature > 0:
+        return await _call_llm(llm, messages, stream, limiter)
+
+    key = LLMCache.make_key(model, messages, tools_sig)
+    cached = await cache.get(key)
+    if cached is not None:
+        logger.info("⚡ LLM cache hit")
+        return cached
+
+    response = await _call_llm(llm, messages, stream, limiter)
+    await cache.put(key, response)
+    return response
+
+
+async def _call_llm(llm, messages: list, stream: bool, limiter=None) -> AIMessage:
+    """Invoke the LLM, optionally streaming and merging the response chunks"""
+    if limiter:
+        await limiter.acquire(estimate_tokens(messages, completion_limit(llm)))
+
+    if not stream:
+        return await llm.ainvoke(messages)
+
+    # Chunks are emitted as they arrive (visible via stream_mode="messages");
+    # adding them merges content and tool call fragments into one message
+    response = None
+    async for chunk in llm.astream(messages):
+        response = chunk if response is None else response + chunk
+    return response
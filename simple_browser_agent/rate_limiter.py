@@ -0,0 +1,164 @@
+"""
+Client-side rate limiting for Azure OpenAI calls.
+
+Azure enforces requests-per-minute (RPM) and tokens-per-minute (TPM) quotas
+per deployment and answers with HTTP 429 once they are exceeded. Pacing
+requests on the client avoids spending wall time on rejected calls and
+retry backoff.
+"""
+import asyncio
+import logging
+import math
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Image size assumed when estimating image tokens: screenshots are
+# downscaled to at most 1024px wide (SimpleBrowserSession.screenshot_max_width)
+IMAGE_SIZE = (1024, 768)
+
+# Completion budget reserved per call when the client sets no max_tokens.
+# Azure counts the completion against the TPM quota as well as the prompt.
+DEFAULT_COMPLETION_TOKENS = 512
+
+
+class _Bucket:
+    """Token bucket that refills continuously up to a per-minute capacity"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0  # Refill per second
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if available now)"""
+        return max(0.0, (amount - self.level) / self.rate)
+
+
+class AsyncRateLimiter:
+    """Paces calls to stay under an RPM and/or TPM quota"""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None
+    ):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        # Held while waiting so callers are served in arrival order
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 0):
+        """Wait until one request and `tokens` prompt tokens fit the quota"""
+        async with self._lock:
+            while True:
+                wait = 0.0
+                if self._requests:
+                    self._requests.refill()
+                    wait = max(wait, self._requests.wait_time(1))
+                if self._tokens:
+                    self._tokens.refill()
+                    # A single oversized prompt can only ever wait for a full bucket
+                    tokens = min(tokens, self._tokens.capacity)
+                    wait = max(wait, self._tokens.wait_time(tokens))
+
+                if wait <= 0:
+                    if self._requests:
+                        self._requests.level -= 1
+                    if self._tokens:
+                        self._tokens.level -= tokens
+                    return
+
+                logger.info(f"⏳ Rate limit: waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
+
+
+def image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """
+    Tokens an image costs, following OpenAI's vision pricing.
+    
+    Low detail is a flat 85 tokens. Otherwise the image is scaled to fit
+    2048x2048, then its shortest side to 768px, and costs 170 tokens per
+    512px tile plus 85.
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return 170 * tiles + 85
+
+
+def estimate_tokens(messages: list, max_tokens: Optional[int] = None) -> int:
+    """
+    Rough token cost of a call, as counted against a TPM quota.
+    
+    Text is ~4 characters per token, images are priced by detail level
+    (assuming IMAGE_SIZE), and the completion budget is added on top.
+    
+    Args:
+        messages: Messages to send
+        max_tokens: The call's completion limit (DEFAULT_COMPLETION_TOKENS if unset)
+    """
+    chars = 0
+    images = 0
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            for part in content:
+                if not isinstance(part, dict):
+                    continue
+                if part.get("type") == "text":
+                    chars += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    detail = part.get("image_url", {}).get("detail", "auto")
+                    images += image_tokens(*IMAGE_SIZE, detail)
+    return chars // 4 + images + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def completion_limit(llm) -> Optional[int]:
+    """The max_tokens set on a chat model, looking through bind_tools() bindings"""
+    return getattr(getattr(llm, "bound", llm), "max_tokens", None)
+
+
+_limiters: Dict[Tuple[str, str], AsyncRateLimiter] = {}
+
+
+def get_rate_limiter(
+    azure_endpoint: str,
+    deployment: str,
+    requests_per_minute: Optional[int] = None,
+    tokens_per_minute: Optional[int] = None
+) -> Optional[AsyncRateLimiter]:
+    """
+    Return the shared limiter for an endpoint/deployment.
+
+    Quotas are per deployment, so every agent calling the same deployment
+    must draw from the same limiter. Returns None when no limits are set.
+    The first caller's limits win; later callers asking for different
+    limits get a warning.
+    """
+    if not requests_per_minute and not tokens_per_minute:
+        return None
+    key = (azure_endpoint, deployment)
+    if key not in _limiters:
+        _limiters[key] = AsyncRateLimiter(requests_per_minute, tokens_per_minute)
+    limiter = _limiters[key]
+    if (limiter.requests_per_minute, limiter.tokens_per_minute) != (requests_per_minute, tokens_per_minute):
+        logger.warning(
+            f"⚠️ Rate limiter for {deployment} already exists with "
+            f"RPM={limiter.requests_per_minute}, TPM={limiter.tokens_per_minute}; "
+            f"ignoring RPM={requests_per_minute}, TPM={tokens_per_minute}"
+        )
+    return limiter
@@ -4,14 +4,113 @@ LangGraph-compatible browser tools for the browser agent.
 This module provides browser actions as LangGraph @tool decorated functions.
 Tools are created via a factory pattern to inject browser and LLM context.
 """
+import asyncio
+import functools
+import hashlib
+import json
 import logging
+import re
+import uuid
+from collections import OrderedDict
 from typing import Any, Optional
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.tools import tool
 
+from browser import CDPError
+from rate_limiter import completion_limit, estimate_tokens
+
 logger = logging.getLogger(__name__)
 
+# Page text sent to the LLM by extract (~2500 tokens at ~4 characters per token)
+EXTRACT_MAX_CHARS = 10000
+
+# Answers to extract queries, shared by every agent in the process. Asking
+# the same question about the same page text again skips the LLM call.
+EXTRACT_CACHE_SIZE = 256
+_extract_cache = OrderedDict()  # {(model, content digest, query): answer}
+
+# How long the first of several concurrent extract calls waits for others
+# on the same page text to join it in a single LLM call
+EXTRACT_BATCH_WINDOW = 0.02
+
+# Built once rather than validated again on every extract call
+_EXTRACT_SYSTEM = SystemMessage(content="You are a helpful assistant that extracts information from web pages.")
+
+# Page state the click tool compares before and after clicking. Content
+# changes (nodes added or removed, text edited in place) are counted by a
+# MutationObserver, installed by the first snapshot on each page, instead
+# of serializing the whole body to measure it. Regions that update on
+# their own - live regions, timers, tickers, status lines - are not
+# counted, so clocks and news tickers do not make every click look like
+# it changed the page. Carousels slide by changing styles, which are not
+# counted either.
+_JS_CLICK_STATE = """
+function() {
+    if (window.__sbaMutations === undefined) {
+        window.__sbaMutations = 0;
+        const selfUpdating = '[aria-live]:not([aria-live="off"]), [role="timer"], [role="marquee"], ' +
+            '[role="status"], [role="log"], [role="progressbar"], marquee';
+        new MutationObserver(records => {
+            for (const record of records) {
+                const el = record.target.nodeType === 1 ? record.target : record.target.parentElement;
+                if (!el || !el.closest(selfUpdating)) window.__sbaMutations++;
+            }
+        }).observe(document, {subtree: true, childList: true, characterData: true});
+    }
+    return {
+        url: window.location.href,
+        modalCount: document.querySelectorAll('[role="dialog"], .modal, [class*="modal"], [class*="popup"], [class*="overlay"]').length,
+        mutations: window.__sbaMutations,
+        cartText: document.querySelector('[class*="cart"], [aria-label*="cart"], [id*="cart"]')?.textContent || ''
+    };
+}
+""".strip()
+
+# Keep the state before clicking in the page - it never crosses the websocket.
+# Each click stores it under its own __TOKEN__, so concurrent clicks do not
+# overwrite each other's state.
+_JS_BEFORE_CLICK_TEMPLATE = """
+(window.__sbaClickStates = window.__sbaClickStates || {})['__TOKEN__'] = (%s)();
+true
+""" % _JS_CLICK_STATE
 
-def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
+# Once the DOM has gone 150ms without mutating (capped at 800ms), compare
+# the page with the stored state and report only what kind of change the
+# click caused. If the state is gone (a new document was loaded), report
+# 'unknown' at once without waiting for the new page to settle - the
+# caller decides from the navigation events whether the click navigated.
+_JS_AFTER_CLICK_TEMPLATE = """
+(async () => {
+    const before = (window.__sbaClickStates || {})['__TOKEN__'];
+    if (before === undefined) return {kind: 'unknown', url: window.location.href};
+    delete window.__sbaClickStates['__TOKEN__'];
+    await new Promise(resolve => {
+        let quiet;
+        const finish = () => {
+            observer.disconnect();
+            clearTimeout(quiet);
+            clearTimeout(cap);
+            resolve();
+        };
+        const observer = new MutationObserver(() => {
+            clearTimeout(quiet);
+            quiet = setTimeout(finish, 150);
+        });
+        observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+        quiet = setTimeout(finish, 150);
+        const cap = setTimeout(finish, 800);
+    });
+    const after = (%s)();
+    if (after.url !== before.url) return {kind: 'nav', url: after.url};
+    if (after.modalCount > before.modalCount) return {kind: 'modal'};
+    if (after.cartText !== before.cartText) return {kind: 'cart'};
+    if (after.mutations > before.mutations) return {kind: 'content'};
+    return {kind: 'none'};
+})()
+""" % _JS_CLICK_STATE
+
+
+def create_browser_tools(browser, llm, model: str = "gpt-4o-mini", limiter=None):
     """
     Create all browser tools with browser and LLM context injected via closure.
     
@@ -19,6 +118,7 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
         browser: SimpleBrowserSession instance
         llm: LangChain AzureChatOpenAI client
         model: Model name for LLM operations
+        limiter: Optional AsyncRateLimiter shared with the planning node
         
     Returns:
         List of 9 LangGraph-compatible tools
@@ -80,46 +180,57 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
             - click(0) - Clicks the element at index 0
             - click(5) - Clicks the element at index 5
         """
+        token = uuid.uuid4().hex
+        # A main-frame navigation seen during the click is what decides "navigated"
+        # when the page state cannot be read (e.g. the context was destroyed)
+        navigated = browser._expect_event('Page.frameNavigated', frame_id=browser.target_id)
+        
+        async def navigation_url(wait: float = 0) -> Optional[str]:
+            """URL of the main-frame navigation seen during this click, if any"""
+            if wait and not navigated.done():
+                await asyncio.wait({navigated}, timeout=wait)
+            if navigated.done() and not navigated.cancelled():
+                return navigated.result()['frame'].get('url')
+            return None
+        
         try:
-            import asyncio
-            
-            # Capture state before click
-            js_before = """
-            (function() {
-                return {
-                    url: window.location.href,
-                    modalCount: document.querySelectorAll('[role="dialog"], .modal, [class*="modal"], [class*="popup"], [class*="overlay"]').length,
-                    bodyHash: document.body.innerHTML.length,
-                    cartText: document.querySelector('[class*="cart"], [aria-label*="cart"], [id*="cart"]')?.textContent || ''
-                };
-            })();
-            """
-            result = await browser._send_command('Runtime.evaluate', {
-                'expression': js_before,
-                'returnByValue': True
-            }, session_id=browser.session_id)
-            state_before = result.get('result', {}).get('value', {})
-            
-            # Perform click (CDP mouse events)
-            success = await browser.click(index)
+            # Capture state before click and perform click (CDP mouse events).
+            # Chrome handles a session's commands in order, so the snapshot
+            # sent just ahead of the click still sees the page before it
+            before, success = await asyncio.gather(
+                browser._send_command('Runtime.evaluate', {
+                    'expression': _JS_BEFORE_CLICK_TEMPLATE.replace('__TOKEN__', token),
+                    'returnByValue': True
+                }, session_id=browser.session_id),
+                browser.click(index),
+                return_exceptions=True
+            )
+            if isinstance(success, BaseException):
+                raise success
+            if isinstance(before, BaseException):
+                before_error = str(before)
+            elif 'exceptionDetails' in before:
+                before_error = before['exceptionDetails'].get('text', 'script error')
+            else:
+                before_error = None
             
             if not success:
                 # Fallback: Try JavaScript click using CDP's DOM.resolveNode and Runtime.callFunctionOn
                 logger.info(f"CDP click failed for element {index}, trying JavaScript click...")
-                if index in browser.element_cache:
+                if 0 <= index < len(browser.element_cache):
                     node_id = browser.element_cache[index]
                     try:
-                        # Resolve the node to get a remote object
-                        resolve_result = await browser._send_command('DOM.resolveNode', {
-                            'nodeId': node_id
-                        }, session_id=browser.session_id)
+                        # Resolve the node to get a remote object (cached per page)
+                        object_id = await browser._resolve_object_id(node_id)
                         
-                        if 'object' in resolve_result:
+                        if object_id:
                             # Call click() on the resolved object
+                            started, loaded = browser._expect_navigation()
                             await browser._send_command('Runtime.callFunctionOn', {
                                 'functionDeclaration': 'function() { this.click(); }',
-                                'objectId': resolve_result['object']['objectId']
+                                'objectId': object_id
                             }, session_id=browser.session_id)
+                            await browser._wait_for_navigation(started, loaded)
                             logger.info(f"✓ JavaScript click executed for element {index}")
                         else:
                             return f"❌ Element {index} not found or not clickable"
@@ -129,30 +240,50 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
                 else:
                     return f"❌ Element {index} not found in cache"
             
-            # Wait for page response
-            await asyncio.sleep(0.8)
-            
-            # Capture state after click
-            result = await browser._send_command('Runtime.evaluate', {
-                'expression': js_before,
-                'returnByValue': True
-            }, session_id=browser.session_id)
-            state_after = result.get('result', {}).get('value', {})
+            if before_error:
+                # The click went through, but there is nothing to compare with
+                logger.warning(f"Page state before click failed: {before_error}")
+                url = await navigation_url()
+                if url:
+                    return f"✅ Clicked element {index} → Page navigated to {url}"
+                return f"⚠️ Clicked element {index} - could not capture the page before clicking, so changes are unknown ({before_error})"
             
-            # Analyze what changed
-            url_changed = state_after.get('url') != state_before.get('url')
-            modal_appeared = state_after.get('modalCount', 0) > state_before.get('modalCount', 0)
-            page_changed = abs(state_after.get('bodyHash', 0) - state_before.get('bodyHash', 0)) > 100
-            cart_changed = state_after.get('cartText', '') != state_before.get('cartText', '')
+            # Find out what the click changed, once the page has settled. Any
+            # navigation was already awaited by the click itself
+            try:
+                result = await browser._send_command('Runtime.evaluate', {
+                    'expression': _JS_AFTER_CLICK_TEMPLATE.replace('__TOKEN__', token),
+                    'returnByValue': True,
+                    'awaitPromise': True
+                }, session_id=browser.session_id)
+            except CDPError:
+                # A navigation committing during the settle wait destroys the
+                # page's context under the script - the click did its job
+                url = await navigation_url(wait=1.0)
+                if url is None:
+                    raise
+                return f"✅ Clicked element {index} → Page navigated to {url}"
+            if 'exceptionDetails' in result:
+                after_error = result['exceptionDetails'].get('text', 'script error')
+                logger.warning(f"Page state after click failed: {after_error}")
+                url = await navigation_url(wait=1.0)
+                if url:
+                    return f"✅ Clicked element {index} → Page navigated to {url}"
+                return f"⚠️ Clicked element {index} - could not check what changed ({after_error})"
+            change = result.get('result', {}).get('value', {})
+            kind = change.get('kind')
+            url = await navigation_url()
             
             # Determine what happened
-            if url_changed:
-                return f"✅ Clicked element {index} → Page navigated to {state_after.get('url')}"
-            elif modal_appeared:
+            if kind == 'nav' or url:
+                return f"✅ Clicked element {index} → Page navigated to {change.get('url') or url}"
+            elif kind == 'unknown':
+                return f"⚠️ Clicked element {index} - the page state was lost without a navigation, so changes are unknown"
+            elif kind == 'modal':
                 return f"✅ Clicked element {index} → Modal/popup appeared"
-            elif cart_changed:
+            elif kind == 'cart':
                 return f"✅ Clicked element {index} → Cart updated (item likely added)"
-            elif page_changed:
+            elif kind == 'content':
                 return f"✅ Clicked element {index} → Page content changed"
             else:
                 # Nothing obvious changed - but click happened
@@ -161,6 +292,8 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
         except Exception as e:
             logger.error(f"Click failed: {e}")
             return f"❌ Click error: {str(e)}"
+        finally:
+            browser._forget_event(navigated)
     
     # ==============================================================
     # TOOL 3: INPUT_TEXT
@@ -199,6 +332,65 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
     # TOOL 4: EXTRACT
     # ==============================================================
     
+    extract_batches = {}  # {content digest: [(query, Future), ...]}
+    
+    async def extract_answers(content: str, queries: list) -> list:
+        """
+        Answer several queries about the same page content with one LLM call.
+        
+        Several queries are answered as a JSON array of strings. Falls back to
+        one call per query if the reply is not an array with exactly one
+        string per query.
+        
+        Args:
+            content: Page text the queries are about
+            queries: Queries to answer
+            
+        Returns:
+            One answer per query, in order
+        """
+        if len(queries) == 1:
+            query_text = f"Query: {queries[0]}"
+            instructions = "Provide a concise answer based only on the page content. If the information is not available, say so."
+        else:
+            query_text = "Queries:\n" + "\n".join(f"{n}) {q}" for n, q in enumerate(queries, 1))
+            instructions = (f"Reply with only a JSON array of {len(queries)} strings: the answers to the queries, in order. "
+                            "Base the answers only on the page content. If the information is not available, say so in that answer.")
+        
+        # Use LLM to extract information
+        prompt = f"""Extract the following information from the page content:
+
+{query_text}
+
+Page content:
+{content}
+
+{instructions}"""
+
+        # Use LangChain invoke API
+        messages = [_EXTRACT_SYSTEM, HumanMessage(content=prompt)]
+        
+        if limiter:
+            await limiter.acquire(estimate_tokens(messages, completion_limit(llm)))
+        response = await llm.ainvoke(messages)
+        if len(queries) == 1:
+            return [response.content]
+        
+        # Models sometimes wrap JSON in a ```json fence
+        reply = re.sub(r'^```(?:json)?\s*|\s*```$', '', response.content.strip())
+        try:
+            answers = json.loads(reply)
+        except ValueError:
+            answers = None
+        if (isinstance(answers, list) and len(answers) == len(queries)
+                and all(isinstance(answer, str) for answer in answers)):
+            logger.info(f"⚡ Answered {len(queries)} extract queries with one LLM call")
+            return [answer.strip() for answer in answers]
+        
+        logger.warning("Batched extract answer is not a JSON array of answers - asking separately")
+        separate = await asyncio.gather(*(extract_answers(content, [q]) for q in queries))
+        return [answer for [answer] in separate]
+    
     @tool
     async def extract(query: str) -> str:
         """
@@ -220,33 +412,48 @@ def create_browser_tools(browser, llm, model: str = "gpt-4o-mini"):
             - extract("list all items in the cart")
         """
         try:
-            # Get page content
-            content = await browser.extract_content()
+            # Get page content, one character past the limit to detect truncation
+            content = await browser.extract_content(max_chars=EXTRACT_MAX_CHARS + 1)
             
-            # Limit content length
-            if len(content) > 10000:
-                content = content[:10000] + "...[truncated]"
+            # Limit content length, cutting at a word boundary rather than mid-word
+            if len(content) > EXTRACT_MAX_CHARS:
+                cut = content.rfind(' ', 0, EXTRACT_MAX_CHARS)
+                content = content[:cut if cut > 0 else EXTRACT_MAX_CHARS] + "...[truncated]"
             
-            # Use LLM to extract information
-            prompt = f"""Extract the following information from the page content:
-
-Query: {query}
-
-Page content:
-{content}
-
-Provide a concise answer based only on the page content. If the information is not available, say so."""
-
-            # Use LangChain invoke API
-            from langchain_core.messages import SystemMessage, HumanMessage
+            key = (model, hashlib.blake2b(content.encode(), digest_size=16).hexdigest(), query)
+            if key in _extract_cache:
+                _extract_cache.move_to_end(key)
+                logger.info("⚡ Extract cache hit")
+                return f"✅ Extracted: {_extract_cache[key]}"
             
-            messages = [
-                SystemMessage(content="You are a helpful assistant that extracts information from web pages."),
-                HumanMessage(content=prompt)
-            ]
+            # Concurrent extracts of the same page text share one LLM call:
+            # the first caller waits briefly for others to join its batch
+            future = asyncio.get_running_loop().create_future()
+            batch = extract_batches.get(key[1])
+            if batch is not None:
+                batch.append((query, future))
+                extracted = await future
+            else:
+                batch = extract_batches[key[1]] = [(query, future)]
+                try:
+                    await asyncio.sleep(EXTRACT_BATCH_WINDOW)
+                    del extract_batches[key[1]]
+                    answers = await extract_answers(content, [q for q, _ in batch])
+                except BaseException as e:
+                    extract_batches.pop(key[1], None)
+                    error = e if isinstance(e, Exception) else RuntimeError("Extract cancelled")
+                    for _, waiter in batch[1:]:
+                        if not waiter.done():
+                            waiter.set_exception(error)
+                    raise
+                for (_, waiter), answer in zip(batch[1:], answers[1:]):
+                    if not waiter.done():
+                        waiter.set_result(answer)
+                extracted = answers[0]
             
-            response = await llm.ainvoke(messages)
-            extracted = response.content
+            _extract_cache[key] = extracted
+            while len(_extract_cache) > EXTRACT_CACHE_SIZE:
+                _extract_cache.popitem(last=False)
             
             return f"✅ Extracted: {extracted}"
         except Exception as e:
@@ -345,7 +552,7 @@ Provide a concise answer based only on the page content. If the information is n
     # ==============================================================
     
     @tool
-    def ask_user(question: str) -> str:
+    async def ask_user(question: str) -> str:
         """
         Ask the user a question and wait for their response in the terminal.
         
@@ -367,7 +574,12 @@ Provide a concise answer based only on the page content. If the information is n
             print("🤔 USER INPUT NEEDED")
             print("="*70)
             print(f"\n{question}\n")
-            user_response = input("Your response: ").strip()
+            # input() blocks - run it off the event loop so other tools keep going
+            loop = asyncio.get_running_loop()
+            user_response = await loop.run_in_executor(
+                None, functools.partial(input, "Your response: ")
+            )
+            user_response = user_response.strip()
             print("="*70 + "\n")
             return f"✅ User responded: {user_response}"
         except Exception as e:
@@ -379,7 +591,7 @@ Provide a concise answer based only on the page content. If the information is n
     # ==============================================================
     
     @tool
-    def done(result: str, success: bool = True) -> str:
+    async def done(result: str, success: bool = True) -> str:
         """
         Mark the task as complete and return final results.
         
@@ -409,7 +621,6 @@ Provide a concise answer based only on the page content. If the information is n
 async def test_tools():
     """Test tools with real browser"""
     from browser import SimpleBrowserSession
-    import asyncio
     
     logger.info("Starting browser tools test...")
     browser = SimpleBrowserSession(headless=False)
@@ -454,6 +665,5 @@ async def test_tools():
 
 if __name__ == '__main__':
     # Run standalone test
-    import asyncio
     logging.basicConfig(level=logging.INFO, format='%(message)s')
     asyncio.run(test_tools())